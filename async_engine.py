@@ -0,0 +1,415 @@
+"""
+Authors: Isaac Misri, Sergio Drajner
+Description: This script contains the asyncio crawl engine, selected with
+--engine async instead of the default gevent one. Listing pages, option pages
+and feature pages are all downloaded by one scheduler (a single event loop,
+aiohttp session and URL frontier), and parsed with the same functions used by
+Products and Features. Pages go through the same response cache and
+checkpoint, and the same rate limiter and retries, as with the gevent engine.
+"""
+import sys
+import asyncio
+import logging
+import aiohttp
+from product_info_functions import Products
+from features_functions import Features
+import web_scraper_config as CFG
+from scheduler import Scheduler
+import fetcher
+import checkpoint
+
+crawler = None
+
+
+class AsyncCrawler(Scheduler):
+    """
+    This is the class related to the asyncio crawl. Requested pages are queued
+    by priority and downloaded by concurrency workers (at most
+    CFG.PER_HOST_CONCURRENCY from the same host), and kept as described in
+    Scheduler, as with the URL frontier of the gevent engine. The products
+    crawl starts together with the features crawl, so that both share the
+    connections and the concurrency limit.
+    """
+    def __init__(self, **kwargs):
+        """
+        Constructor for AsyncCrawler.
+        :param kwargs: parameters received from the CLI
+        """
+        super().__init__()
+        self.concurrency = \
+            CFG.CONCURRENCY if kwargs.get('concurrency') is None else kwargs['concurrency']
+        read_timeout = CFG.READ_TIMEOUT if kwargs.get('timeout') is None else kwargs['timeout']
+        self.timeout = aiohttp.ClientTimeout(sock_connect=CFG.CONNECT_TIMEOUT,
+                                             sock_read=read_timeout)
+        self.loop = asyncio.new_event_loop()
+        self.session = None
+        self.queue = None
+        self.stream = kwargs.get('stream')
+        self.listing_pages = None
+        self.products_task = None
+
+    def run(self, coroutine):
+        """
+        Runs a coroutine in the event loop of the crawler until it is done.
+        Tasks that are still pending keep running the next time.
+        :param coroutine: coroutine to run
+        :return: the result of the coroutine
+        """
+        return self.loop.run_until_complete(coroutine)
+
+    async def start(self):
+        """
+        Creates the session, the queue of pages and its workers (inside the
+        event loop) and schedules the products crawl, if they do not exist yet.
+        :return:
+        """
+        if self.session is None:
+            self.queue = asyncio.PriorityQueue()
+            for _ in range(self.concurrency):
+                asyncio.ensure_future(self.work())
+            connector = aiohttp.TCPConnector(limit=self.concurrency,
+                                             limit_per_host=CFG.PER_HOST_CONCURRENCY)
+            self.session = aiohttp.ClientSession(connector=connector,
+                                                 timeout=self.timeout,
+                                                 headers=fetcher.HEADERS)
+        if self.products_task is None:
+            self.listing_pages = asyncio.Queue(CFG.PIPELINE_QUEUE_SIZE)
+            self.products_task = asyncio.ensure_future(self.crawl_listing_pages())
+
+    def close(self):
+        """
+        Cancels the downloads that are still running (if the crawl was
+        interrupted), and closes the session and the event loop.
+        :return:
+        """
+        self.run(self.stop())
+        self.loop.close()
+
+    async def stop(self):
+        """
+        Cancels the pending tasks of the event loop and closes the session.
+        :return:
+        """
+        pending_tasks = [task for task in asyncio.all_tasks()
+                         if task is not asyncio.current_task()]
+        for task in pending_tasks:
+            task.cancel()
+        await asyncio.gather(*pending_tasks, return_exceptions=True)
+        if self.session is not None:
+            await self.session.close()
+
+    def create_result(self):
+        """
+        :return: result: future with the response of the page
+        """
+        return self.loop.create_future()
+
+    def enqueue(self, item):
+        """
+        Queues a page for the workers.
+        :param item: (priority, order, url, result)
+        :return:
+        """
+        self.queue.put_nowait(item)
+
+    async def work(self):
+        """
+        Downloads the queued pages, one after the other.
+        :return:
+        """
+        while True:
+            _, _, url, future = await self.queue.get()
+            try:
+                web_page = await self.download(url)
+            except Exception as error:
+                logging.error(f'Could not download {url}: {error}')
+                web_page = None
+            self.downloaded(url, future, web_page)
+            future.set_result(web_page)
+
+    async def download(self, url):
+        """
+        Downloads the page of the given url through the session of the
+        crawler, taking the steps decided by fetcher.download (cache, rate
+        limiter and retries), as the gevent engine does.
+        :param url: string
+        :return: web_page: response object, or None if the page could not be downloaded
+        """
+        steps = fetcher.download(url)
+        reply = None
+        try:
+            while True:
+                step, value = steps.send(reply)
+                if step == fetcher.SEND:
+                    reply = await self.send(url, value)
+                else:
+                    await asyncio.sleep(value)
+                    reply = None
+        except StopIteration as stop:
+            return stop.value
+
+    async def send(self, url, headers):
+        """
+        Sends a request for the page of the given url through the session of
+        the crawler.
+        :param url: string
+        :param headers: dictionary with the headers of the request
+        :return: web_page: response object, or None if the request failed
+        """
+        try:
+            async with self.session.get(url, headers=headers) as response:
+                return fetcher.build_response(url, response.status, response.headers,
+                                              await response.read(), response.charset)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as error:
+            logging.error(f'Could not download {url}: {error}')
+            return None
+
+    async def get(self, url, priority):
+        """
+        :param url: string
+        :param priority: int - priority of the page
+        :return: web_page: response object of the page, or None if it could not be downloaded
+        """
+        future = self.request(url, priority)
+        web_page = await future
+        self.release(url, future)
+        return web_page
+
+    async def parse(self, url, priority, parse_function, *args, keep=True):
+        """
+        Returns the result of parse_function for the content of a page (and
+        args). Each page is parsed only once by each parse_function, unless
+        its result is not kept.
+        :param url: string
+        :param priority: int - priority of the page
+        :param parse_function: function that takes the content of the page and args
+        :param args: other arguments of parse_function
+        :param keep: bool - False not to keep the result once it is returned
+        :return: the result of parse_function, or None if the page could not be downloaded
+        """
+        key = self.get_key(url, parse_function, args)
+        if key in self.parsed:
+            return self.parsed[key]
+        return self.parse_page(key, await self.get(url, priority), parse_function, args, keep)
+
+    def crawl_products(self, stream_page=None):
+        """
+        Waits for the products crawl (starting it if the features were not
+        crawled first).
+        :param stream_page: function called with the url, the listing page and
+        the rows of each listing page (and of its option pages) as soon as they
+        are all available, in the order of the pages, or None to return all
+        the pages at the end
+        :return: pages: list of (url, listing_page, page_rows), in the order of
+        the pages (empty if stream_page is given)
+        :return: crawl_is_complete: bool - True if all the listing pages were crawled
+        """
+        return self.run(self.get_products(stream_page))
+
+    async def get_products(self, stream_page=None):
+        """
+        Gathers the rows of the listing pages (and of their option pages) in
+        the order of the pages, as they are crawled.
+        :param stream_page: function called with each page, or None
+        :return: the result of the products crawl
+        """
+        await self.start()
+        pages = []
+        page = await self.listing_pages.get()
+        while page is not None:
+            url, listing_page, options_tasks = page
+            page_rows = list(listing_page['rows'])
+            for options_rows in await asyncio.gather(*options_tasks):
+                page_rows.extend(options_rows)
+            if stream_page is None:
+                pages.append((url, listing_page, page_rows))
+            else:
+                stream_page(url, listing_page, page_rows)
+            page = await self.listing_pages.get()
+        return pages, await self.products_task
+
+    async def crawl_listing_pages(self):
+        """
+        Crawls the listing pages in order (each one has the link to the next
+        one, and the following ones are requested ahead when the pagination
+        gives their number). The option pages of every listing page are
+        scheduled as soon as it is parsed, so they are downloaded
+        while the following listing pages are crawled. Every listing page is
+        put in listing_pages (with its url and the tasks of its option pages)
+        as soon as it is parsed, followed by None when the crawl ends. The
+        crawl waits when CFG.PIPELINE_QUEUE_SIZE pages are waiting to be
+        gathered, so that it does not run ahead of them by the whole shop.
+        :return: crawl_is_complete: bool - True if all the listing pages were crawled
+        """
+        try:
+            crawl_is_complete = await self.crawl_next_listing_pages()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            await self.listing_pages.put(None)
+            raise
+        await self.listing_pages.put(None)
+        return crawl_is_complete
+
+    async def crawl_next_listing_pages(self):
+        """
+        Crawls the listing pages, putting each one in listing_pages. When the
+        number of pages is known from the pagination, the following
+        CFG.LISTING_PREFETCH pages that are not in the checkpoint are requested
+        with each page. With --stream, the pages are added to the checkpoint
+        once they are written.
+        :return: crawl_is_complete: bool - True if all the listing pages were crawled
+        """
+        crawl_is_complete = False
+        url_second_part = CFG.URL_SECOND_PART_FIRST_TIME
+        while True:
+            url = CFG.URL_FIRST_PART + url_second_part
+            listing_page = Products.get_completed_page(url, stream=self.stream)
+            if listing_page is None:
+                logging.info(f'Processing page {url}')
+                listing_page = await self.parse(url, CFG.LISTING_PRIORITY,
+                                                Products.parse_listing_page,
+                                                keep=not self.stream)
+                if listing_page is None:
+                    logging.error(f"Could not download page {url}. ")
+                    print(f'Could not download page {url}. '
+                          f'Run again with --resume to continue from this page',
+                          file=sys.stderr)
+                    break
+                if not self.stream:
+                    checkpoint.add(CFG.CHECKPOINT_LISTING_PAGES, url, listing_page)
+            else:
+                logging.info(f'Page {url} taken from the checkpoint')
+            for listing_url in Products.get_listing_urls(listing_page, CFG.LISTING_PREFETCH):
+                if Products.get_completed_page(listing_url, stream=self.stream) is None:
+                    self.request(listing_url, CFG.LISTING_PRIORITY)
+            options_tasks = [asyncio.ensure_future(self.crawl_options_page(name, product_url))
+                             for name, product_url in listing_page['options']]
+            await self.listing_pages.put((url, listing_page, options_tasks))
+            url_second_part = listing_page['next']
+            if url_second_part is None:
+                crawl_is_complete = True
+                break
+        return crawl_is_complete
+
+    async def crawl_options_page(self, filter_product_name, filter_product_url):
+        """
+        Gets the rows of the options available to the product (from the
+        checkpoint if its page was already completed by a previous crawl).
+        With --stream, the rows are neither kept nor added to the checkpoint.
+        :param filter_product_name: name of the product
+        :param filter_product_url: url of the product to find its options
+        :return: products_rows: list of dictionaries, one per option
+        """
+        url = CFG.URL_FIRST_PART + filter_product_url
+        products_rows = checkpoint.get(CFG.CHECKPOINT_OPTION_PAGES, url)
+        if products_rows is not None:
+            logging.info(f'Product page {url} taken from the checkpoint')
+            return products_rows
+        logging.info(f'Processing product page {url} (with options)')
+        products_rows = await self.parse(url, CFG.OPTION_PRIORITY,
+                                         Products.parse_options_page, filter_product_name,
+                                         keep=not self.stream)
+        if products_rows is None:
+            logging.error(f'Product {filter_product_name} disregarded')
+            return []
+        if not self.stream:
+            checkpoint.add(CFG.CHECKPOINT_OPTION_PAGES, url, products_rows)
+        return products_rows
+
+    def crawl_features(self):
+        """
+        Crawls the features and their products. The products crawl starts
+        at the same time.
+        :return: feature_dict: dictionary with the list of products of each feature
+        """
+        return self.run(self.get_features())
+
+    async def get_features(self):
+        """
+        Downloads the list of features, then the first page of all the
+        features at the same time, and then the remaining pages of all the
+        features at the same time. Features already completed by a previous
+        crawl are taken from the checkpoint instead.
+        :return: feature_dict: dictionary with the list of products of each feature
+        """
+        await self.start()
+        url = CFG.URL_FIRST_PART + CFG.URL_SECOND_PART_FIRST_TIME + CFG.URL_PAGE_TAG
+        features_and_urls = await self.parse(url, CFG.LISTING_PRIORITY, Features.parse_features)
+        if features_and_urls is None:
+            print('could not retrieve source code from url', file=sys.stderr)
+            logging.error('could not retrieve source code from url')
+            return {}
+        completed_features = [checkpoint.get(CFG.CHECKPOINT_FEATURES,
+                                             feature_and_url[CFG.FEATURE_INDEX])
+                              for feature_and_url in features_and_urls]
+        first_pages = await asyncio.gather(*[self.get(feature_and_url[CFG.URL_INDEX],
+                                                      CFG.FEATURE_PRIORITY)
+                                             for feature_and_url, products
+                                             in zip(features_and_urls, completed_features)
+                                             if products is None])
+
+        feature_dict = {}
+        additional_pages = []
+        first_pages = iter(first_pages)
+        for feature_and_url, products in zip(features_and_urls, completed_features):
+            if products is not None:
+                feature_dict[feature_and_url[CFG.FEATURE_INDEX]] = products
+                continue
+            additional_pages.extend(Features.process_feature(fetcher.get_content(next(first_pages)),
+                                                             0, feature_and_url, feature_dict))
+        pages_products = await asyncio.gather(*[self.crawl_feature_page(feature_and_url, url)
+                                                for feature_and_url, url in additional_pages])
+        for (feature_and_url, _), product_names in zip(additional_pages, pages_products):
+            feature_and_url[CFG.PRODUCT_INDEX].extend(product_names)
+
+        for feature_and_url, products in zip(features_and_urls, completed_features):
+            feature = feature_and_url[CFG.FEATURE_INDEX]
+            if products is None and feature in feature_dict:
+                checkpoint.add(CFG.CHECKPOINT_FEATURES, feature, feature_dict[feature])
+        print('Features extracted!', file=sys.stderr)
+        logging.info('Features extracted')
+        return feature_dict
+
+    async def crawl_feature_page(self, feature_and_url, url):
+        """
+        Downloads and parses an additional page (page 2 onwards) of a feature.
+        :param feature_and_url: list - feature, url of its first page and its products
+        :param url: string - url of the page
+        :return: product_names: list of the names of the products of the page
+        """
+        logging.info(f'Now extracting from {url} of '
+                     f'Feature:{feature_and_url[CFG.FEATURE_INDEX]}')
+        product_names = await self.parse(url, CFG.FEATURE_PRIORITY, Features.parse_page_products)
+        if product_names is None:
+            logging.error(f'webpage {url} unavailable')
+            return []
+        return product_names
+
+
+def configure(**kwargs):
+    """
+    Creates the crawler of the asyncio engine.
+    :param kwargs: parameters received from the CLI
+    :return:
+    """
+    global crawler
+    crawler = AsyncCrawler(**kwargs)
+
+
+def get_crawler():
+    """
+    :return: crawler: the crawler of the asyncio engine (created on first use)
+    """
+    if crawler is None:
+        configure()
+    return crawler
+
+
+def close():
+    """
+    Closes the crawler, if it was created.
+    :return:
+    """
+    if crawler is not None:
+        crawler.close()
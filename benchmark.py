@@ -0,0 +1,333 @@
+"""
+Authors: Isaac Misri, Sergio Drajner
+Description: This script benchmarks the web scraper without using the web
+shop. It starts the local web shop of benchmark_server.py in its own process
+(with synthetic pages, or with pages recorded from the web shop with
+--record), points CFG.URL_FIRST_PART at it and runs the features, products and
+database stages, reporting for each one its time, pages and rows per second,
+parse time and dataframe building time. The options after -- are passed to the
+web scraper:
+    python3 benchmark.py --products 10000 --features 200 -- --engine async -c 20
+"""
+import os
+import sys
+import csv
+import json
+import time
+import hashlib
+import logging
+import tempfile
+import subprocess
+import urllib.request
+import click
+import web_scraper_config as CFG
+import web_scraper
+
+SERVER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_server.py')
+SCRAPER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'web_scraper.py')
+STARTUP_COMMANDS = [['--help'], ['--version'], ['--no-scrape', '--no-verbose']]
+STARTUP_TOP_MODULES = 10
+STARTUP_PRODUCT = ['Plant', '', '', 9.99, False]
+SERVER_START_TIMEOUT = 30
+SERVER_POLL_TIME = 0.1
+STATS_PATH = '/__stats'
+INDEX_FILE = 'index.json'
+DEFAULT_SCRAPER_ARGS = ['--no-cache', '--rate', '0']
+REPORT_COLUMNS = ['Stage', 'Time (s)', 'Pages', 'Pages/s', 'Rows', 'Rows/s', 'Parse (s)',
+                  'Dataframe (s)']
+REPORT_COLUMN_WIDTH = 14
+
+
+class Timer:
+    """
+    This is the class related to the time spent in the functions wrapped by
+    a timer.
+    """
+    def __init__(self):
+        """
+        Constructor for Timer.
+        """
+        self.seconds = 0.0
+
+    def wrap(self, function):
+        """
+        :param function: function to time
+        :return: a function that calls function and adds its duration to the timer
+        """
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.seconds += time.perf_counter() - start
+        return timed
+
+
+def get_scraper_kwargs(scraper_args):
+    """
+    :param scraper_args: list of the options for the web scraper
+    :return: kwargs: parameters of the web scraper, as received from its CLI
+    """
+    context = web_scraper.main.make_context('web_scraper.py',
+                                            DEFAULT_SCRAPER_ARGS + list(scraper_args))
+    return dict(context.params, scrape=True)
+
+
+def start_server(port, products, features, fixtures):
+    """
+    Starts the local web shop and waits until it answers.
+    :param port: int
+    :param products: int - number of synthetic products
+    :param features: int - number of synthetic features
+    :param fixtures: string - folder with recorded pages, or None for synthetic ones
+    :return: server: the process of the local web shop
+    """
+    command = [sys.executable, SERVER_SCRIPT, '--port', str(port),
+               '--products', str(products), '--features', str(features)]
+    if fixtures:
+        command += ['--fixtures', fixtures]
+    server = subprocess.Popen(command)
+    deadline = time.monotonic() + SERVER_START_TIMEOUT
+    while time.monotonic() < deadline:
+        try:
+            get_server_stats(port)
+            return server
+        except OSError:
+            if server.poll() is not None:
+                break
+            time.sleep(SERVER_POLL_TIME)
+    server.terminate()
+    raise click.ClickException(f'The local web shop did not start on port {port}')
+
+
+def get_server_stats(port):
+    """
+    :param port: int
+    :return: dictionary with the numbers of pages and bytes served by the local web shop
+    """
+    with urllib.request.urlopen(f'http://127.0.0.1:{port}{STATS_PATH}') as response:
+        return json.load(response)
+
+
+def run_stage(name, stage, port, parse_timer, dataframe_timer):
+    """
+    Runs a stage of the web scraper and measures it.
+    :param name: string - name of the stage
+    :param stage: function that runs the stage and returns the number of rows it produced
+    :param port: int - port of the local web shop
+    :param parse_timer: Timer of the parsing of pages
+    :param dataframe_timer: Timer of the building of dataframes
+    :return: dictionary with the measures of the stage
+    """
+    parse_timer.seconds = dataframe_timer.seconds = 0.0
+    stats_before = get_server_stats(port)
+    start = time.perf_counter()
+    rows = stage()
+    seconds = time.perf_counter() - start
+    stats_after = get_server_stats(port)
+    pages = stats_after['pages'] - stats_before['pages']
+    return {'Stage': name,
+            'Time (s)': seconds,
+            'Pages': pages,
+            'Pages/s': pages / seconds if seconds else 0,
+            'Rows': rows,
+            'Rows/s': rows / seconds if seconds else 0,
+            'Parse (s)': parse_timer.seconds,
+            'Dataframe (s)': dataframe_timer.seconds}
+
+
+def print_report(results):
+    """
+    Prints the measures of every stage as a table.
+    :param results: list of dictionaries with the measures of each stage
+    :return:
+    """
+    print(''.join(column.rjust(REPORT_COLUMN_WIDTH) for column in REPORT_COLUMNS))
+    for result in results:
+        print(''.join((f'{result[column]:.2f}' if isinstance(result[column], float)
+                       else str(result[column])).rjust(REPORT_COLUMN_WIDTH)
+                      for column in REPORT_COLUMNS))
+
+
+def measure_startup(scraper_args):
+    """
+    Runs the web scraper in a new python process with -X importtime.
+    :param scraper_args: list of the options for the web scraper
+    :return: seconds, imports: time of the whole run and list of (module, seconds
+    to import it, including the modules it imports) for the modules imported at
+    the top level, the slowest first
+    """
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, '-X', 'importtime', SCRAPER_SCRIPT] + scraper_args,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                            universal_newlines=True)
+    seconds = time.perf_counter() - start
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        _, cumulative, module = line.split('|')
+        if cumulative.strip().isdigit() and not module.startswith('  '):
+            imports.append((module.strip(), int(cumulative) / 10 ** 6))
+    return seconds, sorted(imports, key=lambda module_import: -module_import[1])
+
+
+def report_startup():
+    """
+    Measures the startup of the web scraper for each of STARTUP_COMMANDS, and
+    prints its time and the modules that took the longest to import. The
+    runs without scraping read a features.csv and a products.csv of a single
+    product written in the current folder.
+    :return:
+    """
+    from features_functions import Features
+    Features.write_features({'Feature': [STARTUP_PRODUCT[CFG.NAME_INDEX]]})
+    with open('products.csv', 'w', newline='') as products_file:
+        writer = csv.writer(products_file)
+        writer.writerow(CFG.PRODUCTS_COLUMNS)
+        writer.writerow(STARTUP_PRODUCT)
+    for scraper_args in STARTUP_COMMANDS:
+        seconds, imports = measure_startup(scraper_args)
+        print(f'web_scraper.py {" ".join(scraper_args)}: {seconds:.3f} s')
+        for module, import_seconds in imports[:STARTUP_TOP_MODULES]:
+            print(f'    {module:<30}{import_seconds:.3f} s')
+
+
+def run_benchmark(port, with_db, **kwargs):
+    """
+    Runs the features, products and (optionally) database stages of the web
+    scraper against the local web shop.
+    :param port: int - port of the local web shop
+    :param with_db: bool - True to also write the results to the database
+    :param kwargs: parameters of the web scraper
+    :return: list of dictionaries with the measures of each stage
+    """
+    import pymysql
+    import parsing
+    from features_functions import Features
+    from product_info_functions import Products
+
+    parse_timer = Timer()
+    dataframe_timer = Timer()
+    parsing.make_soup = parse_timer.wrap(parsing.make_soup)
+    Features.filter_features = dataframe_timer.wrap(Features.filter_features)
+    Products.build_products_df = dataframe_timer.wrap(Products.build_products_df)
+
+    scraped = {}
+
+    def scrape_features():
+        scraped['features'] = Features(**kwargs)
+        return len(scraped['features'].features_and_products_df)
+
+    def scrape_products():
+        scraped['products'] = Products(scraped['features'].features_and_products_df, **kwargs)
+        return len(scraped['products'].products_df)
+
+    def write_database():
+        if kwargs['db_mode'].lower() == 'replace':
+            scraped['products'].fill_products_df()
+            scraped['features'].fill_features_df()
+        else:
+            scraped['products'].sync_products_df()
+            scraped['features'].sync_features_df()
+        scraped['products'].snapshot_products_df()
+        return len(scraped['products'].products_df) \
+            + len(scraped['features'].features_and_products_df)
+
+    results = [run_stage('features', scrape_features, port, parse_timer, dataframe_timer),
+               run_stage('products', scrape_products, port, parse_timer, dataframe_timer)]
+    if kwargs['engine'] == 'async':
+        import async_engine
+        async_engine.close()
+    if with_db:
+        try:
+            results.append(run_stage('database', write_database, port, parse_timer,
+                                     dataframe_timer))
+        except pymysql.MySQLError as error:
+            print(f'Database stage skipped: {error}')
+    return results
+
+
+def record(directory, **kwargs):
+    """
+    Scrapes the web shop and records every page that was downloaded in the
+    given folder, together with an index of the pages by canonical url.
+    :param directory: string - folder where the pages are recorded
+    :param kwargs: parameters of the web scraper
+    :return:
+    """
+    import fetcher
+    from urls import canonicalize
+    from features_functions import Features
+    from product_info_functions import Products
+
+    features = Features(**kwargs)
+    Products(features.features_and_products_df, **kwargs)
+    if kwargs['engine'] == 'async':
+        import async_engine
+        async_engine.close()
+    os.makedirs(directory, exist_ok=True)
+    index = {}
+    for url in fetcher.cache.get_urls():
+        entry = fetcher.cache.lookup(url)
+        if entry is None or not url.startswith(CFG.URL_FIRST_PART):
+            continue
+        file_name = hashlib.sha1(url.encode()).hexdigest() + '.html'
+        with open(os.path.join(directory, file_name), 'wb') as page_file:
+            page_file.write(entry[CFG.BODY_INDEX])
+        index[canonicalize(url[len(CFG.URL_FIRST_PART):])] = file_name
+    with open(os.path.join(directory, INDEX_FILE), 'w') as index_file:
+        json.dump(index, index_file, indent=4)
+    print(f'{len(index)} pages recorded in {directory}')
+
+
+@click.command()
+@click.option('--products', help='Number of synthetic products (Default: 1000)', type=int,
+              default=1000)
+@click.option('--features', help='Number of synthetic features (Default: 20)', type=int,
+              default=20)
+@click.option('--fixtures', help='Folder with the pages recorded with --record, to be served '
+                                 'instead of synthetic pages', type=click.Path(file_okay=False))
+@click.option('--record', 'record_directory',
+              help='Scrape the web shop and record its pages in this folder instead of '
+                   'benchmarking', type=click.Path(file_okay=False))
+@click.option('--port', help='Port of the local web shop (Default: 8765)', type=int, default=8765)
+@click.option('--startup', is_flag=True, help='Measure the startup time of the web scraper and '
+                                              'the time to import each module instead')
+@click.option('--db/--no-db', help='Also benchmark writing to the database (Default: no)?',
+              default=False)
+@click.argument('scraper_args', nargs=-1, type=click.UNPROCESSED)
+def main(products, features, fixtures, record_directory, port, startup, db,
+         scraper_args):
+    """
+    Benchmarks the web scraper against a local copy of the web shop. The
+    options after -- are passed to the web scraper.
+    """
+    logging.basicConfig(level=logging.WARNING)
+    if record_directory:
+        kwargs = get_scraper_kwargs(list(scraper_args) + ['--cache'])
+        CFG.CACHE_DIRECTORY = tempfile.mkdtemp()
+    else:
+        kwargs = get_scraper_kwargs(scraper_args)
+    fixtures = os.path.abspath(fixtures) if fixtures else None
+    directory = os.path.abspath(record_directory) if record_directory else None
+    os.chdir(tempfile.mkdtemp())
+    if startup:
+        report_startup()
+        return
+    if record_directory:
+        web_scraper.configure(**kwargs)
+        record(directory, **kwargs)
+        return
+
+    server = start_server(port, products, features, fixtures)
+    try:
+        CFG.URL_FIRST_PART = f'http://127.0.0.1:{port}'
+        web_scraper.configure(**kwargs)
+        print_report(run_benchmark(port, db, **kwargs))
+    finally:
+        server.terminate()
+
+
+if __name__ == '__main__':
+    main()
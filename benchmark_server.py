@@ -0,0 +1,229 @@
+"""
+Authors: Isaac Misri, Sergio Drajner
+Description: This script contains the local web shop used by benchmark.py.
+It serves either the pages recorded from the web shop (benchmark fixtures) or
+synthetic pages with the same structure for any number of products and
+features, and counts the pages and bytes it serves. It runs in its own
+process:
+    python3 benchmark_server.py --port 8765 --products 10000 --features 200
+"""
+import os
+import json
+import random
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+import click
+import web_scraper_config as CFG
+from urls import canonicalize
+
+PRODUCTS_PER_PAGE = 24
+OPTIONS_EVERY = 3
+SOLD_OUT_EVERY = 7
+OPTIONS = ['4 inch', '6 inch', '8 inch']
+FEATURE_SHARE = (0.01, 0.1)
+LISTING_PATH = urlsplit(CFG.URL_SECOND_PART_FIRST_TIME).path
+STATS_PATH = '/__stats'
+INDEX_FILE = 'index.json'
+
+
+class SyntheticShop:
+    """
+    This is the class related to the synthetic web shop: products_count
+    products (a third of them with options) and features_count features, each
+    one with a random sample of the products.
+    """
+    def __init__(self, products_count, features_count, seed):
+        """
+        Constructor for SyntheticShop.
+        :param products_count: int - number of products
+        :param features_count: int - number of features
+        :param seed: int - seed of the random samples of the features
+        """
+        generator = random.Random(seed)
+        self.products = [{'name': f'Plant {index:06d}',
+                          'handle': f'plant-{index}',
+                          'price': round(5 + index % 500 * 0.37, 2),
+                          'has_options': index % OPTIONS_EVERY == 0,
+                          'is_sold_out': index % SOLD_OUT_EVERY == 0}
+                         for index in range(products_count)]
+        self.features = {}
+        for index in range(features_count):
+            share = generator.uniform(*FEATURE_SHARE)
+            self.features[f'feature-{index}'] = sorted(
+                generator.sample(range(products_count),
+                                 max(1, min(products_count, int(products_count * share)))))
+        self.cards = [self.make_card(product) for product in self.products]
+
+    @staticmethod
+    def make_card(product):
+        """
+        :param product: dictionary
+        :return: html of the card of the product in a grid
+        """
+        price = f'{CFG.HAS_OPTIONS} ${product["price"]}' if product['has_options'] \
+            else f'${product["price"]}'
+        sold_out = '<span>Sold out</span>' if product['is_sold_out'] else ''
+        title = f'<h2 class="productitem--title">' \
+                f'<a href="/products/{product["handle"]}">{product["name"]}</a></h2>'
+        return f'<li class="productgrid--item imagestyle--natural productitem--emphasis ' \
+               f'show-actions--mobile"><div class="productitem"><div class="productitem--info">' \
+               f'{title}<div class="price--main">{price}</div>{sold_out}</div></div></li>'
+
+    @staticmethod
+    def make_pagination(base_url, page, pages):
+        """
+        :param base_url: string - url of the collection, to which page=N is appended
+        :param page: int - current page
+        :param pages: int - number of pages of the collection
+        :return: html of the pagination links
+        """
+        links = ''.join(f'<a class="pagination--item" href="{base_url}page={number}">{number}</a>'
+                        for number in range(1, pages + 1))
+        if page < pages:
+            return links + f'<a class="pagination--item" href="{base_url}page={page + 1}">Next</a>'
+        return links + '<a class="pagination--item" href="#">Last</a>'
+
+    def make_collection(self, indexes, base_url, page, filters=''):
+        """
+        :param indexes: list of the indexes of the products of the collection
+        :param base_url: string - url of the collection
+        :param page: int - page to show
+        :param filters: string - html of the features list
+        :return: html of a page of a collection
+        """
+        pages = max(1, -(-len(indexes) // PRODUCTS_PER_PAGE))
+        cards = ''.join(self.cards[index] for index in
+                        indexes[(page - 1) * PRODUCTS_PER_PAGE:page * PRODUCTS_PER_PAGE])
+        return f'<html><body><ul>{filters}</ul><div id="shopify-section-static-collection">' \
+               f'<ul class="productgrid--items products-per-row-4">{cards}</ul>' \
+               f'{self.make_pagination(base_url, page, pages)}</div></body></html>'
+
+    @staticmethod
+    def make_product(product):
+        """
+        :param product: dictionary
+        :return: html of the page of a product with options
+        """
+        options = ''
+        for index, option in enumerate(OPTIONS):
+            option_info = f'{option}{CFG.SEPARATOR}sold_out' \
+                if product['is_sold_out'] and index == len(OPTIONS) - 1 \
+                else f'{option}{CFG.SEPARATOR}${product["price"] + index}'
+            options += f'<option value="{index}">\n {option_info}\n</option>\n'
+        return f'<html><body><div id="shopify-section-static-product">' \
+               f'<span class="option-name">Size: {OPTIONS[0]}</span>' \
+               f'<select name="id">{options}</select></div></body></html>'
+
+    def get_page(self, request_path):
+        """
+        :param request_path: string - path and parameters of the requested url
+        :return: html of the page, or None if it does not exist
+        """
+        url = urlsplit(request_path)
+        path = url.path
+        page = int(parse_qs(url.query.lstrip('?')).get('page', ['1'])[0])
+        if path == LISTING_PATH:
+            filters = ''.join(f'<li class="filter-item" data-handle="{feature}">'
+                              f'<a href="{LISTING_PATH}/{feature}">{feature}</a></li>'
+                              for feature in self.features)
+            return self.make_collection(range(len(self.products)), LISTING_PATH + '?', page,
+                                        filters)
+        if path.startswith(LISTING_PATH + '/'):
+            indexes = self.features.get(path.rsplit('/', 1)[1])
+            if indexes is None:
+                return None
+            return self.make_collection(indexes, path + '?grid_list=grid-view&', page)
+        if path.startswith('/products/plant-'):
+            index = int(path.rsplit('-', 1)[1])
+            return self.make_product(self.products[index]) if index < len(self.products) else None
+        return None
+
+
+class RecordedShop:
+    """
+    This is the class related to the pages recorded from the web shop by
+    benchmark.py --record. Pages are found by their canonical url.
+    """
+    def __init__(self, directory):
+        """
+        Constructor for RecordedShop.
+        :param directory: string - folder with the recorded pages and their index
+        """
+        self.directory = directory
+        with open(os.path.join(directory, INDEX_FILE)) as index_file:
+            self.index = json.load(index_file)
+
+    def get_page(self, request_path):
+        """
+        :param request_path: string - path and parameters of the requested url
+        :return: html of the page, or None if it was not recorded
+        """
+        file_name = self.index.get(canonicalize(request_path))
+        if file_name is None:
+            return None
+        with open(os.path.join(self.directory, file_name), 'rb') as page_file:
+            return page_file.read()
+
+
+def make_handler(shop, stats):
+    """
+    :param shop: SyntheticShop or RecordedShop
+    :param stats: dictionary with the numbers of pages and bytes served
+    :return: the class of the request handler of the server
+    """
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        """
+        This is the class related to the requests to the local web shop.
+        """
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            if self.path == STATS_PATH:
+                self.send_page(json.dumps(stats).encode(), 'application/json')
+                return
+            page = shop.get_page(self.path)
+            if page is None:
+                self.send_response(404)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            page = page.encode() if isinstance(page, str) else page
+            with lock:
+                stats['pages'] += 1
+                stats['bytes'] += len(page)
+            self.send_page(page, 'text/html; charset=utf-8')
+
+        def send_page(self, content, content_type):
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+    return Handler
+
+
+@click.command()
+@click.option('--port', help='Port of the local web shop', type=int, default=8765)
+@click.option('--products', help='Number of synthetic products', type=int, default=1000)
+@click.option('--features', help='Number of synthetic features', type=int, default=20)
+@click.option('--fixtures', help='Folder with recorded pages to serve instead of synthetic ones',
+              type=click.Path(exists=True, file_okay=False))
+@click.option('--seed', help='Seed of the synthetic features', type=int, default=1)
+def main(port, products, features, fixtures, seed):
+    """
+    Serves the local web shop until it is interrupted.
+    """
+    shop = RecordedShop(fixtures) if fixtures else SyntheticShop(products, features, seed)
+    stats = {'pages': 0, 'bytes': 0}
+    ThreadingHTTPServer(('127.0.0.1', port), make_handler(shop, stats)).serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""
+Authors: Isaac Misri, Sergio Drajner
+Description: This script contains the checkpoint of the crawl. Every listing
+page, option page and feature that is completed is appended to the checkpoint
+file, so that an interrupted crawl can be resumed with --resume without
+processing them again.
+"""
+import os
+import sys
+import json
+import logging
+import web_scraper_config as CFG
+
+completed = {}
+checkpoint_file = None
+
+
+def configure(**kwargs):
+    """
+    Starts a new checkpoint file, or loads the previous one and keeps adding
+    to it if the crawl is being resumed.
+    :param kwargs: parameters received from the CLI
+    :return:
+    """
+    global completed, checkpoint_file
+    completed = {CFG.CHECKPOINT_LISTING_PAGES: {},
+                 CFG.CHECKPOINT_OPTION_PAGES: {},
+                 CFG.CHECKPOINT_FEATURES: {}}
+    if kwargs.get('resume'):
+        load()
+    checkpoint_file = open(CFG.CHECKPOINT_FILE, 'w')
+    for kind, entries in completed.items():
+        for key, value in entries.items():
+            write(kind, key, value)
+
+
+def load():
+    """
+    Loads the work completed by the previous crawl from the checkpoint file.
+    A line that was left incomplete by an interruption is ignored.
+    :return:
+    """
+    try:
+        with open(CFG.CHECKPOINT_FILE) as previous_file:
+            for line in previous_file:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                completed[entry['kind']][entry['key']] = entry['value']
+    except FileNotFoundError:
+        print('No checkpoint was found, starting a new crawl', file=sys.stderr)
+        return
+    logging.info(f"Resuming crawl: {len(completed[CFG.CHECKPOINT_LISTING_PAGES])} listing pages, "
+                 f"{len(completed[CFG.CHECKPOINT_OPTION_PAGES])} option pages and "
+                 f"{len(completed[CFG.CHECKPOINT_FEATURES])} features already completed")
+
+
+def get(kind, key):
+    """
+    :param kind: string - kind of work (listing page, option page or feature)
+    :param key: string - url of the page or name of the feature
+    :return: value stored when the work was completed, or None if it was not
+    """
+    return completed.get(kind, {}).get(key)
+
+
+def add(kind, key, value):
+    """
+    Records a completed piece of work in the checkpoint.
+    :param kind: string - kind of work (listing page, option page or feature)
+    :param key: string - url of the page or name of the feature
+    :param value: information needed to reuse the work (json serializable)
+    :return:
+    """
+    if checkpoint_file is None:
+        return
+    completed[kind][key] = value
+    write(kind, key, value)
+
+
+def write(kind, key, value):
+    """
+    Appends an entry to the checkpoint file.
+    :param kind: string - kind of work
+    :param key: string - url of the page or name of the feature
+    :param value: information needed to reuse the work
+    :return:
+    """
+    checkpoint_file.write(json.dumps({'kind': kind, 'key': key, 'value': value}) + '\n')
+    checkpoint_file.flush()
+
+
+def clear():
+    """
+    Removes the checkpoint once the crawl has been completed, and forgets the
+    completed work.
+    :return:
+    """
+    global completed, checkpoint_file
+    completed = {}
+    if checkpoint_file is None:
+        return
+    checkpoint_file.close()
+    checkpoint_file = None
+    os.remove(CFG.CHECKPOINT_FILE)
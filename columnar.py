@@ -0,0 +1,67 @@
+"""
+Authors: Isaac Misri, Sergio Drajner
+Description: This script contains the functions that write the products and
+features to Parquet or Feather (Arrow IPC) files with explicit column types,
+and read them back through pyarrow datasets, skipping the rows that do not
+match the filters as they are read.
+"""
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+
+
+def get_file_name(name, file_format):
+    """
+    :param name: string - name of the data (products or features)
+    :param file_format: string - parquet or feather
+    :return: file_name: string
+    """
+    return f'{name}.{file_format}'
+
+
+def write(df, name, file_format, dtypes):
+    """
+    Writes a dataframe to a Parquet or Feather file, with the given column types.
+    :param df: dataframe
+    :param name: string - name of the data (products or features)
+    :param file_format: string - parquet or feather
+    :param dtypes: dictionary with the type of each column
+    :return:
+    """
+    table = pa.Table.from_pandas(df.astype(dtypes), preserve_index=False)
+    if file_format == 'parquet':
+        pq.write_table(table, get_file_name(name, file_format))
+    else:
+        feather.write_feather(table, get_file_name(name, file_format))
+
+
+def read(name, file_format, columns, filter_expression=None):
+    """
+    Reads the given columns of a Parquet or Feather file, keeping only the
+    rows that match filter_expression.
+    :param name: string - name of the data (products or features)
+    :param file_format: string - parquet or feather
+    :param columns: list of the names of the columns to read
+    :param filter_expression: pyarrow dataset expression, or None to read all the rows
+    :return: df: dataframe
+    """
+    dataset = ds.dataset(get_file_name(name, file_format), format=file_format)
+    return dataset.to_table(columns=columns, filter=filter_expression).to_pandas()
+
+
+def get_products_filter(**kwargs):
+    """
+    :param kwargs: filtering parameters (price and sold_out)
+    :return: filter_expression: pyarrow dataset expression for the price range
+    and the sold out status, or None if there are no such filters
+    """
+    filter_expression = None
+    if kwargs.get('price'):
+        low, high = (pa.scalar(price, pa.float32()) for price in kwargs['price'])
+        filter_expression = (ds.field('Price') >= low) & (ds.field('Price') <= high)
+    if kwargs.get('sold_out') is not None:
+        sold_out_expression = ds.field('Is Sold Out') == kwargs['sold_out']
+        filter_expression = sold_out_expression if filter_expression is None \
+            else filter_expression & sold_out_expression
+    return filter_expression
@@ -3,7 +3,8 @@ USE plant_db;
 
 CREATE TABLE general_product_names(
     type_id int NOT NULL PRIMARY KEY,
-    type_name varchar(100) UNIQUE
+    type_name varchar(100) UNIQUE,
+    from_api bool NOT NULL DEFAULT FALSE
 );
 
 
@@ -13,17 +14,30 @@ CREATE TABLE all_products(
     full_product_name varchar(100) UNIQUE,
     price float,
     sold_out bool,
+    from_api bool NOT NULL DEFAULT FALSE,
     FOREIGN KEY (type_id) REFERENCES general_product_names(type_id)
 );
 
+CREATE TABLE product_snapshots(
+    snapshot_id int NOT NULL AUTO_INCREMENT PRIMARY KEY,
+    full_product_name varchar(100) NOT NULL,
+    price float,
+    sold_out bool,
+    captured_at datetime NOT NULL,
+    INDEX product_captured_at (full_product_name, captured_at)
+);
+
 CREATE TABLE features (
     feature_id int NOT NULL PRIMARY KEY,
-    feature_name varchar(100) UNIQUE
+    feature_name varchar(100) UNIQUE,
+    from_api bool NOT NULL DEFAULT FALSE
 );
 
 
 CREATE TABLE features_prod_join(
     feature_id int,
-    type_name varchar(100)
+    type_name varchar(100),
+    from_api bool NOT NULL DEFAULT FALSE,
+    UNIQUE (feature_id, type_name)
 );
 
@@ -1,158 +1,190 @@
+"""
+Authors: Isaac Misri, Sergio Drajner
+Description: This script contains the functions that are used to write into
+the plant_db SQL database. Rows are inserted in batches (executemany) inside a
+single transaction per table instead of one commit per row. All user
+information to connect to the database can be modified in the
+web_scraper_config.py file.
+"""
+import logging
 import pymysql.cursors
 import web_scraper_config as CFG
-import output_processing as op
+import metrics
 
 
-def fill_products_df(df):
+def connect():
     """
-    This function takes a dataframe of products and inserts all the data into the general_product_name
-    and all_products tables in a pre-existing plant_db SQL database.
-    The tables are first refreshed before values are updated. All user information to connect
-    to the database can be modified in the web_scraper_config.py file.
+    :return: connection: a new connection to the plant_db SQL database
     """
-    connection = pymysql.connect(host=CFG.SQL_HOST,
-                                 user=CFG.SQL_USER,
-                                 password=CFG.SQL_PASS,
-                                 db=CFG.SQL_DB,
-                                 charset=CFG.SQL_CHARSET,
-                                 cursorclass=pymysql.cursors.DictCursor
-                                 )
+    return pymysql.connect(host=CFG.SQL_HOST,
+                           user=CFG.SQL_USER,
+                           password=CFG.SQL_PASS,
+                           db=CFG.SQL_DB,
+                           charset=CFG.SQL_CHARSET,
+                           cursorclass=pymysql.cursors.DictCursor
+                           )
 
-    try:
-        with connection.cursor() as cursor:
-            sql_command_delete_general = """DELETE FROM general_product_names"""
-            cursor.execute(sql_command_delete_general)
-        connection.commit()
-    except Exception:
-        pass
 
+def clear_tables(connection, tables):
+    """
+    Deletes all the rows of the given tables in a single transaction. Tables
+    are cleared in the given order, so referencing tables must come first.
+    :param connection: connection to the database
+    :param tables: list of table names
+    :return:
+    """
     try:
         with connection.cursor() as cursor:
-            sql_command_delete_all = """ DELETE FROM all_products"""
-            cursor.execute(sql_command_delete_all)
+            for table in tables:
+                cursor.execute(f"DELETE FROM {table}")
         connection.commit()
-    except Exception:
-        pass
-
-    repeated = {}
-    type_id = 0
-    product_id = 0
-
-    for index, rows in df.iterrows():
-        if index[CFG.NAME_INDEX] not in repeated.keys():
-            repeated[index[CFG.NAME_INDEX]] = type_id
-            type_id += 1
-
-            if rows['Is Sold Out'] == True:
-                bool_val = 1
-            else:
-                bool_val = 0
-
-            try:
-                with connection.cursor() as cursor:
-                    sql_command_general = """ INSERT INTO general_product_names VALUES (%s, %s)"""
-                    cursor.execute(sql_command_general, (repeated.get(index[CFG.NAME_INDEX]),
-                                                         index[CFG.NAME_INDEX]))
-                connection.commit()
-            except Exception:
-                pass
+    except pymysql.MySQLError as error:
+        connection.rollback()
+        logging.error(f'Could not clear tables {", ".join(tables)}: {error}')
 
-            try:
-                with connection.cursor() as cursor:
-                    sql_command_products = """ INSERT INTO all_products VALUES (%s, %s, %s, %s, %s)"""
-                    cursor.execute(sql_command_products,
-                                   (product_id, repeated.get(index[CFG.NAME_INDEX]),
-                                    index[CFG.NAME_INDEX] + ' ' + str(index[CFG.TYPE_INDEX]) + ' ' +
-                                    str(index[CFG.OPTION_INDEX]), rows['Price'], bool_val))
 
-                connection.commit()
-            except Exception:
-                pass
+def fetch_rows(connection, table, columns):
+    """
+    :param connection: connection to the database
+    :param table: table name
+    :param columns: list of column names
+    :return: list of dictionaries with the given columns of every row of the table
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT {', '.join(columns)} FROM {table}")
+        return cursor.fetchall()
 
-        else:
 
-            if rows['Is Sold Out'] == True:
-                bool_val = 1
-            else:
-                bool_val = 0
+def fetch_latest_rows(connection, table, key_column, time_column, columns):
+    """
+    :param connection: connection to the database
+    :param table: table name
+    :param key_column: name of the column that identifies an item
+    :param time_column: name of the column with the time of each row
+    :param columns: list of the other column names to fetch
+    :return: list of dictionaries with key_column and columns of the latest row of each item
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT {', '.join([key_column] + columns)} FROM {table} "
+                       f"JOIN (SELECT {key_column}, MAX({time_column}) AS {time_column} "
+                       f"FROM {table} GROUP BY {key_column}) AS latest "
+                       f"USING ({key_column}, {time_column})")
+        return cursor.fetchall()
 
-            try:
-                with connection.cursor() as cursor:
-                    sql_command_general = """ INSERT INTO general_product_names VALUES (%s, %s)"""
-                    cursor.execute(sql_command_general, (repeated.get(index[CFG.NAME_INDEX]),
-                                                         index[CFG.NAME_INDEX]))
-                connection.commit()
-            except Exception:
-                pass
 
-            try:
-                with connection.cursor() as cursor:
-                    sql_command_products = """ INSERT INTO all_products VALUES (%s, %s, %s, %s, %s)"""
-                    cursor.execute(sql_command_products,
-                                   (product_id, repeated.get(index[CFG.NAME_INDEX]),
-                                    index[CFG.NAME_INDEX] + ' ' + str(index[CFG.TYPE_INDEX]) + ' ' +
-                                    str(index[CFG.OPTION_INDEX]), rows['Price'], bool_val))
-                connection.commit()
-            except Exception:
-                pass
+def next_id(connection, table, id_column):
+    """
+    :param connection: connection to the database
+    :param table: table name
+    :param id_column: name of the id column of the table
+    :return: the first id that is free after all the ids of the table
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT COALESCE(MAX({id_column}) + 1, 0) AS next_id FROM {table}")
+        return cursor.fetchone()['next_id']
 
-        product_id += 1
 
-    connection.close()
+def insert_rows(connection, table, rows, chunk_size=CFG.DB_CHUNK_SIZE):
+    """
+    Inserts rows into a table, chunk_size rows per statement (executemany
+    turns them into multi-row INSERTs), and commits them in a single
+    transaction.
+    :param connection: connection to the database
+    :param table: table name
+    :param rows: list of tuples with the values of each row
+    :param chunk_size: int - number of rows sent in each statement
+    :return: inserted, failed: number of rows inserted and number of rows that failed
+    """
+    if not rows:
+        return 0, 0
+    sql_command = f"INSERT INTO {table} VALUES ({', '.join(['%s'] * len(rows[CFG.FIRST]))})"
+    return write_rows(connection, table, sql_command, rows, chunk_size)
 
 
-def fill_features_df(df):
+def upsert_rows(connection, table, columns, rows, update_columns, chunk_size=CFG.DB_CHUNK_SIZE):
     """
-    This function takes a dataframe of features and inserts all the data into the features
-    and features_prod_join tables in a pre-existing plant_db SQL database.
-    The tables are first refreshed before values are updated. All user information to connect
-    to the database can be modified in the web_scraper_config.py file.
+    Inserts rows into a table, or updates update_columns of the rows whose
+    unique keys already exist (INSERT ... ON DUPLICATE KEY UPDATE), in
+    batches and within a single transaction.
+    :param connection: connection to the database
+    :param table: table name
+    :param columns: list of the column names of the rows
+    :param rows: list of tuples with the values of each row
+    :param update_columns: list of the columns to update when the row already exists
+    :param chunk_size: int - number of rows sent in each statement
+    :return: written, failed: number of rows written and number of rows that failed
     """
-    connection = pymysql.connect(host=CFG.SQL_HOST,
-                                 user=CFG.SQL_USER,
-                                 password=CFG.SQL_PASS,
-                                 db=CFG.SQL_DB,
-                                 charset=CFG.SQL_CHARSET,
-                                 cursorclass=pymysql.cursors.DictCursor
-                                 )
+    if not rows:
+        return 0, 0
+    sql_command = f"INSERT INTO {table} ({', '.join(columns)}) " \
+                  f"VALUES ({', '.join(['%s'] * len(columns))}) " \
+                  f"ON DUPLICATE KEY UPDATE " \
+                  f"{', '.join(f'{column} = VALUES({column})' for column in update_columns)}"
+    return write_rows(connection, table, sql_command, rows, chunk_size)
 
-    try:
-        with connection.cursor() as cursor:
-            sql_command_delete_general = """DELETE FROM features"""
-            cursor.execute(sql_command_delete_general)
-        connection.commit()
-    except Exception:
-        pass
 
+def delete_rows(connection, table, key_columns, keys, chunk_size=CFG.DB_CHUNK_SIZE):
+    """
+    Deletes the rows of a table whose key_columns match the given keys, in
+    batches and within a single transaction.
+    :param connection: connection to the database
+    :param table: table name
+    :param key_columns: list of the column names that identify a row
+    :param keys: list of tuples with the values of key_columns of each row to delete
+    :param chunk_size: int - number of rows deleted in each statement
+    :return: deleted: number of rows deleted
+    """
+    deleted = 0
+    if not keys:
+        return deleted
+    row_placeholder = f"({', '.join(['%s'] * len(key_columns))})"
     try:
-        with connection.cursor() as cursor:
-            sql_command_delete_all = """ DELETE FROM features_prod_join"""
-            cursor.execute(sql_command_delete_all)
-        connection.commit()
-    except Exception:
-        pass
-
-    feature_id = 0
-
-    for row in df.itertuples():
-        try:
-            with connection.cursor() as cursor:
-                sql_command_general = """ INSERT INTO features VALUES (%s, %s)"""
-                cursor.execute(sql_command_general, (feature_id, row[CFG.FEATURE]))
+        with metrics.timer('db_write_seconds'), connection.cursor() as cursor:
+            for start in range(0, len(keys), chunk_size):
+                chunk = keys[start:start + chunk_size]
+                deleted += cursor.execute(f"DELETE FROM {table} "
+                                          f"WHERE ({', '.join(key_columns)}) IN "
+                                          f"({', '.join([row_placeholder] * len(chunk))})",
+                                          [value for key in chunk for value in key])
             connection.commit()
-        except Exception:
-            pass
-
-        for element in row[CFG.PRODUCT]:
-            product = op.clean_product(element)
-            try:
-                with connection.cursor() as cursor:
-                    sql_command_general = """ INSERT INTO features_prod_join VALUES (%s, %s)"""
-                    cursor.execute(sql_command_general, (feature_id, product))
-                connection.commit()
-            except Exception:
-                pass
+    except pymysql.MySQLError as error:
+        connection.rollback()
+        logging.error(f'Could not delete rows from {table}: {error}')
+        return 0
+    metrics.increment('db_rows_deleted', deleted)
+    logging.info(f'{deleted} rows deleted from {table}')
+    return deleted
 
-        feature_id += 1
 
-    connection.close()
+def write_rows(connection, table, sql_command, rows, chunk_size):
+    """
+    Executes sql_command for all the rows, chunk_size rows per statement, and
+    commits them in a single transaction. If a chunk fails, its rows are
+    written one by one so that only the failing rows are skipped.
+    :param connection: connection to the database
+    :param table: table name
+    :param sql_command: string - INSERT command with one placeholder per value
+    :param rows: list of tuples with the values of each row
+    :param chunk_size: int - number of rows sent in each statement
+    :return: written, failed: number of rows written and number of rows that failed
+    """
+    written = failed = 0
+    with metrics.timer('db_write_seconds'), connection.cursor() as cursor:
+        for start in range(0, len(rows), chunk_size):
+            chunk = rows[start:start + chunk_size]
+            try:
+                cursor.executemany(sql_command, chunk)
+                written += len(chunk)
+            except pymysql.MySQLError:
+                for row in chunk:
+                    try:
+                        cursor.execute(sql_command, row)
+                        written += 1
+                    except pymysql.MySQLError as error:
+                        failed += 1
+                        logging.warning(f'Row {row} was not written into {table}: {error}')
+        connection.commit()
+    metrics.increment('db_rows_written', written)
+    metrics.increment('db_rows_failed', failed)
+    logging.info(f'{written} rows written into {table} ({failed} failed)')
+    return written, failed
@@ -5,15 +5,15 @@ the feature options from the url.
 """
 
 import re
+import sys
 import csv
 import json
 import logging
-from bs4 import BeautifulSoup
-import requests
-import grequests
 import pandas as pd
-import pymysql.cursors
 import web_scraper_config as CFG
+import checkpoint
+import metrics
+import profiling
 
 
 class Features:
@@ -30,64 +30,85 @@ class Features:
 
     def process_features_and_products(self, **kwargs):
         """
-        Gets the features from a features.csv created in the features_fiction script.
-        Then, filters the features according to the parameters received.
+        Gets the features from a features.csv created in the features_fiction script
+        (when scraping, the one that was just written; otherwise, the file chosen
+        with --input). Then, filters the features according to the parameters received.
         :param kwargs: parameters received from the CLI
         :return: features_df: dataframe
         """
         if kwargs['scrape']:
-            Features.get_information()
-        features_to_filter_df = pd.read_csv('features.csv', names=['Feature', 'Products'])
-        features_to_filter_df['Products'] = features_to_filter_df['Products'] \
-            .apply(lambda x: x[CFG.BEGINNING:CFG.END].split(', '))
-        features_to_filter_df.fillna("", inplace=True)
-        return self.filter_features(features_to_filter_df, **kwargs)
-
-    def filter_features(self, features_to_filter_df, **kwargs):
-        """
-        Given the dataframe with features to filter, filter them according
-        to the filtering parameters passed at kwargs. Also returns an
-        additional dataframe necessary for filtering.
-        :param features_to_filter_df: dataframe
-        :param kwargs: filtering parameters
-        :return: features_df: filtered dataframe
-        :return features_and_products_df: dataframe with filtered features and
-        their partly filtered products (flattened).
+            Features.get_information(**kwargs)
+            pairs_to_filter_df = Features.read_features()
+        else:
+            pairs_to_filter_df = Features.read_features((kwargs.get('input') or 'csv').lower())
+        return self.filter_features(pairs_to_filter_df, **kwargs)
+
+    @staticmethod
+    def read_features(file_format='csv'):
         """
-        if kwargs['feature'] is None:
-            kwargs['feature'] = ''
-        if kwargs['product'] is None:
-            kwargs['product'] = ''
-        feature_filter = (features_to_filter_df['Feature'].str.contains(kwargs['feature'],
-                                                                        case=False,
-                                                                        regex=False))
-        features_to_filter_df = features_to_filter_df[feature_filter]
-        features_copy_df = features_to_filter_df.copy()
-        features_copy_df['Products'] = features_copy_df['Products'].apply(
-                lambda product_list: [Features.clean_product(product) for product in product_list
-                                      if kwargs['product'].upper() in product.upper()])
-        self.features_df = features_copy_df[features_copy_df['Products'].str.len() > 0]
-        self.features_and_products_df = \
-            pd.DataFrame(self.features_df['Products'].to_list(),
-                         index=[self.features_df['Feature']]).stack()
-        self.features_and_products_df = self.features_and_products_df.reset_index('Feature')
-        self.features_and_products_df.columns = ['Feature', 'Products']
-        return self.features_df, self.features_and_products_df
+        Reads the features store (features.csv, or features.parquet or
+        features.feather created by this script before), which has one row per
+        feature and product.
+        :param file_format: string - csv, parquet or feather
+        :return: pairs_df: dataframe with the Feature and Product columns
+        """
+        if file_format in CFG.COLUMNAR_FORMATS:
+            import columnar
+            try:
+                pairs_df = columnar.read('features', file_format, CFG.FEATURES_COLUMNS)
+            except FileNotFoundError:
+                print(f'Error - Input file {columnar.get_file_name("features", file_format)} '
+                      f'was not found in the current directory')
+                sys.exit(4)
+        else:
+            try:
+                pairs_df = pd.read_csv(CFG.FEATURES_FILE, dtype=str, keep_default_na=False)
+            except FileNotFoundError:
+                print('Error - Input file features.csv was not found in the current directory')
+                sys.exit(4)
+            if list(pairs_df.columns) != CFG.FEATURES_COLUMNS:
+                print('Error - Input file features.csv was written by an older version of the '
+                      'web scraper, please scrape the features again')
+                sys.exit(4)
+        return pairs_df
 
     @staticmethod
-    def clean_product(element):
+    def write_features(features_info):
         """
-        Given an element in the list of products of a feature, returns the
-        name of a product clean of extra characters.
-        :param element: string
-        :return: product: string
+        Writes the features store (features.csv): one row per feature and
+        product, quoted by the csv module so that names with commas or quotes
+        are kept as they are.
+        :param features_info: dictionary with the list of products of each feature
+        :return:
         """
-        product = element.strip('"')
-        product = product.replace("\\", "")
-        while (product.find("'") == 0 and product.rfind("'") == len(product) - 1) \
-                or (product.find('"') == 0 and product.rfind('"') == len(product) - 1):
-            product = product[CFG.BEGINNING:CFG.END]
-        return product
+        with open(CFG.FEATURES_FILE, 'w', newline='') as features_file:
+            writer = csv.writer(features_file)
+            writer.writerow(CFG.FEATURES_COLUMNS)
+            writer.writerows((feature, product) for feature, products in features_info.items()
+                             for product in products)
+
+    @profiling.trace_memory('Features.filter_features')
+    def filter_features(self, pairs_to_filter_df, **kwargs):
+        """
+        Given the dataframe with a row per feature and product, filter the
+        features and the products according to the filtering parameters passed
+        at kwargs (both filters are applied to all the rows at once). Also
+        returns an additional dataframe necessary for filtering.
+        :param pairs_to_filter_df: dataframe with the Feature and Product columns
+        :param kwargs: filtering parameters
+        :return: features_df: filtered dataframe, with the list of products of each feature
+        :return features_and_products_df: dataframe with filtered features and
+        their partly filtered products (flattened).
+        """
+        pairs_filter = pairs_to_filter_df['Feature'].str.contains(kwargs['feature'] or '',
+                                                                  case=False, regex=False) \
+            & pairs_to_filter_df['Product'].str.contains(kwargs['product'] or '',
+                                                         case=False, regex=False)
+        self.features_and_products_df = pairs_to_filter_df[pairs_filter] \
+            .rename(columns={'Product': 'Products'}).reset_index(drop=True)
+        self.features_df = self.features_and_products_df \
+            .groupby('Feature', sort=False, observed=True)['Products'].agg(list).reset_index()
+        return self.features_df, self.features_and_products_df
 
     def sort_features(self, is_in_ascending_order):
         """
@@ -102,84 +123,102 @@ class Features:
 
     def display_features(self, products):
         """
-        Displays the features and its related products.
+        Displays the features and its related products. The information of
+        each product is rendered once and looked up by name, and the whole
+        break-down is printed at once.
         :param products: Products object
         :return:
         """
+        products_info = products.get_products_info()
+        lines = []
         for row in self.features_df.itertuples():
-            print('Feature:', row[CFG.FEATURE])
-            print()
-            print('Product/s:')
-            for element in row[CFG.PRODUCT]:
-                product = Features.clean_product(element)
-                try:
-                    product_info = products.get_product_info(product)
-                    print(product)
-                    print()
-                    print(product_info)
-                    print()
-                    print('-' * CFG.PRODUCT_DIVIDER_LENGTH)
-                except KeyError:
-                    continue
-                    # ignoring inconsistencies between features and products in case
-                    # the scraping process happened in the middle of an web page update.
-            print('-' * CFG.FEATURE_DIVIDER_LENGTH)
+            lines += [f'Feature: {row[CFG.FEATURE]}', '', 'Product/s:']
+            for product in row[CFG.PRODUCT]:
+                # ignoring inconsistencies between features and products in case
+                # the scraping process happened in the middle of an web page update.
+                if product in products_info:
+                    lines += [product, '', products_info[product], '',
+                              '-' * CFG.PRODUCT_DIVIDER_LENGTH]
+            lines.append('-' * CFG.FEATURE_DIVIDER_LENGTH)
+        print('\n'.join(lines))
 
     def fill_features_df(self):
         """
         This function takes a dataframe of features and inserts all the data into the features
         and features_prod_join tables in a pre-existing plant_db SQL database.
-        The tables are first refreshed before values are updated. All user information to connect
-        to the database can be modified in the web_scraper_config.py file.
-        """
-        connection = pymysql.connect(host=CFG.SQL_HOST,
-                                     user=CFG.SQL_USER,
-                                     password=CFG.SQL_PASS,
-                                     db=CFG.SQL_DB,
-                                     charset=CFG.SQL_CHARSET,
-                                     cursorclass=pymysql.cursors.DictCursor
-                                     )
-
-        try:
-            with connection.cursor() as cursor:
-                sql_command_delete_general = """DELETE FROM features"""
-                cursor.execute(sql_command_delete_general)
-            connection.commit()
-        except Exception:
-            pass
-
-        try:
-            with connection.cursor() as cursor:
-                sql_command_delete_all = """ DELETE FROM features_prod_join"""
-                cursor.execute(sql_command_delete_all)
-            connection.commit()
-        except Exception:
-            pass
-
-        feature_id = 0
-
-        df = self.features_df.iloc[1:]
+        The tables are first refreshed before values are updated, and the rows of each table
+        are written in batches within a single transaction.
+        """
+        import db_func
+        df = self.features_df
+        features_rows = []
+        features_prod_join_rows = []
+        for feature_id, row in enumerate(df.itertuples()):
+            features_rows.append((feature_id, row[CFG.FEATURE], False))
+            features_prod_join_rows.extend((feature_id, product, False)
+                                           for product in row[CFG.PRODUCT])
+
+        connection = db_func.connect()
+        db_func.clear_tables(connection, ['features_prod_join', 'features'])
+        features_counts = db_func.insert_rows(connection, 'features', features_rows)
+        join_counts = db_func.insert_rows(connection, 'features_prod_join',
+                                          features_prod_join_rows)
+        connection.close()
+        print(f'Database updated: {features_counts[CFG.INSERTED_INDEX]} features and '
+              f'{join_counts[CFG.INSERTED_INDEX]} feature-product pairs written '
+              f'({features_counts[CFG.FAILED_INDEX] + join_counts[CFG.FAILED_INDEX]} failed)')
+
+    def sync_features_df(self):
+        """
+        This function incrementally synchronizes the features and features_prod_join
+        tables with the dataframe of features: features are matched by feature_name,
+        so only new and removed features and feature-product pairs are written, and
+        existing ids are kept across runs. The rows added by the API enrichment
+        (from_api) are not removed. The rows actually written and removed are
+        reported, together with those that failed.
+        """
+        import db_func
+        df = self.features_df
+        connection = db_func.connect()
+        features_rows = db_func.fetch_rows(connection, 'features',
+                                           ['feature_id', 'feature_name', 'from_api'])
+        feature_ids = {row['feature_name']: row['feature_id'] for row in features_rows}
+        api_features = {row['feature_name'] for row in features_rows if row['from_api']}
+        pairs_rows = db_func.fetch_rows(connection, 'features_prod_join',
+                                        ['feature_id', 'type_name', 'from_api'])
+        current_pairs = {(row['feature_id'], row['type_name']) for row in pairs_rows}
+        api_pairs = {(row['feature_id'], row['type_name'])
+                     for row in pairs_rows if row['from_api']}
+
+        new_features_rows = []
+        scraped_pairs = set()
+        feature_id = db_func.next_id(connection, 'features', 'feature_id')
         for row in df.itertuples():
-            try:
-                with connection.cursor() as cursor:
-                    sql_command_general = """ INSERT INTO features VALUES (%s, %s)"""
-                    cursor.execute(sql_command_general, (feature_id, row[CFG.FEATURE]))
-                connection.commit()
-            except Exception:
-                pass
-
-            for product in row[CFG.PRODUCT]:
-                try:
-                    with connection.cursor() as cursor:
-                        sql_command_general = """ INSERT INTO features_prod_join VALUES (%s, %s)"""
-                        cursor.execute(sql_command_general, (feature_id, product))
-                    connection.commit()
-                except Exception:
-                    pass
-
-            feature_id += 1
-
+            if row[CFG.FEATURE] not in feature_ids:
+                feature_ids[row[CFG.FEATURE]] = feature_id
+                new_features_rows.append((feature_id, row[CFG.FEATURE], False))
+                feature_id += 1
+            scraped_pairs.update((feature_ids[row[CFG.FEATURE]], product)
+                                 for product in row[CFG.PRODUCT])
+        scraped_features = set(df['Feature'])
+        removed_features = [(feature_id,) for feature, feature_id in feature_ids.items()
+                            if feature not in scraped_features and feature not in api_features]
+        removed_pairs = sorted(current_pairs - scraped_pairs - api_pairs)
+
+        features_counts = db_func.insert_rows(connection, 'features', new_features_rows)
+        pairs_counts = db_func.insert_rows(connection, 'features_prod_join',
+                                           [pair + (False,)
+                                            for pair in sorted(scraped_pairs - current_pairs)])
+        deleted_pairs = db_func.delete_rows(connection, 'features_prod_join',
+                                            ['feature_id', 'type_name'], removed_pairs)
+        deleted_features = db_func.delete_rows(connection, 'features', ['feature_id'],
+                                               removed_features)
         connection.close()
+        failed = features_counts[CFG.FAILED_INDEX] + pairs_counts[CFG.FAILED_INDEX] \
+            + len(removed_pairs) - deleted_pairs + len(removed_features) - deleted_features
+        print(f'Database synchronized: {features_counts[CFG.INSERTED_INDEX]} new and '
+              f'{deleted_features} removed features, {pairs_counts[CFG.INSERTED_INDEX]} new and '
+              f'{deleted_pairs} removed feature-product pairs ({failed} failed)')
 
     def output_features(self, **kwargs):
         """
@@ -188,9 +227,15 @@ class Features:
         :return:
         """
         if kwargs['output'].lower() == 'csv':
-            self.features_df.to_csv('features.csv')
+            Features.write_features(dict(zip(self.features_df['Feature'],
+                                             self.features_df['Products'])))
         elif kwargs['output'].lower() == 'json':
             self.features_df.to_json('features.json', orient="index")
+        elif kwargs['output'].lower() in CFG.COLUMNAR_FORMATS:
+            import columnar
+            columnar.write(self.features_df.explode('Products')
+                           .rename(columns={'Products': 'Product'})[CFG.FEATURES_COLUMNS],
+                           'features', kwargs['output'].lower(), CFG.FEATURES_DTYPES)
 
     @staticmethod
     def get_feature(feature, additional_features_and_urls):
@@ -216,9 +261,32 @@ class Features:
         get_feature() and finally returns a list
         of all available features along with their urls
         """
-        additional_features_and_urls = []
+        import frontier
+        features_and_urls = frontier.get_frontier().parse(url, CFG.LISTING_PRIORITY,
+                                                          Features.parse_features)
+        if features_and_urls is None:
+            print('could not retrieve source code from url', file=sys.stderr)
+            logging.error('could not retrieve source code from url')
+            return []
+        return features_and_urls
+
+    @staticmethod
+    def parse_features(source_code):
+        """
+        Given the html script of the homepage, this function returns a list of
+        all available features along with their urls
+        """
+        import parsing
+        return Features.extract_features(parsing.make_soup(source_code, parsing.FEATURES_LIST))
 
-        features_soup = Features.make_soup(url)
+    @staticmethod
+    def extract_features(features_soup):
+        """
+        Given the soup of the features of the homepage, this function calls
+        get_feature() for each feature and returns a list of all available
+        features along with their urls
+        """
+        additional_features_and_urls = []
         features_soup_list = features_soup.find_all('li', class_='filter-item')
 
         for feature in features_soup_list:
@@ -226,20 +294,6 @@ class Features:
 
         return additional_features_and_urls
 
-    @staticmethod
-    def make_soup(url):
-        """
-        Given a url, this function uses requests to access the html script
-        of the url and then uses BeautifulSoup
-        to create and return a BeautifulSoup object to be parsed
-        """
-        try:
-            source_code = requests.get(url).text
-            return BeautifulSoup(source_code, 'html.parser')
-        except Exception:
-            print('could not retrieve source code from url')
-            logging.error('could not retrieve source code from url')
-
     @staticmethod
     def get_num_pages(soup):
         """
@@ -290,127 +344,167 @@ class Features:
             product_names.append(clean_name)
 
     @staticmethod
-    def process_product(all_product_info, product_names, feature_and_url):
+    def get_page_products(feature_and_url, url):
+        """
+        This function downloads and parses an additional page (page 2 onwards)
+        of a feature and returns the names of its products. It runs inside the
+        pool of workers, so pages are parsed as soon as they arrive
+        """
+        import frontier
+        logging.info(f'Now extracting from {url} of '
+                     f'Feature:{feature_and_url[CFG.FEATURE_INDEX]}')
+        product_names = frontier.get_frontier().parse(url, CFG.FEATURE_PRIORITY,
+                                                      Features.parse_page_products)
+        if product_names is None:
+            logging.error(f'webpage {url} unavailable')
+            return []
+        return product_names
+
+    @staticmethod
+    def parse_page_products(source_code):
         """
-        This function is called if there is more than 1 page for a feature.
-        It performs exactly the same task as
-        process_first_page_product() but also extracts the current page
-        number and returns it
+        Given the html script of a page of a feature, this function returns
+        the names of its products
         """
-        for product in all_product_info:
-            # product_name = product.find('h2', class_='productitem--title')
-            # clean_name = product_name.a.text.strip()
-            product_name = product.find('div', class_='productitem--info')
-            clean_name = product_name.find('h2').a.text.strip()
-            product_names.append(clean_name)
-            current_page = int(re.search('page=(\d)',
-                                         feature_and_url[CFG.URL_INDEX]).group(1))
-        return current_page
+        import parsing
+        return Features.extract_page_products(parsing.make_soup(source_code,
+                                                                parsing.PRODUCTS_GRID))
+
+    @staticmethod
+    def extract_page_products(soup):
+        """
+        Given the soup of a page of a feature, this function returns the names
+        of its products
+        """
+        product_names = []
+        all_product_info = Features.find_all_products(soup)
+        Features.process_first_page_product(all_product_info, product_names)
+        return product_names
 
     @staticmethod
-    def process_additional_page_products(num_pages, feature_and_url, product_names, current_page):
-        """
-        This function processes all features that have more than 1 page. It iterates
-        through all the pages of a feature and appends product names to a list for a given feature
-        """
-        for page_num in range(2, num_pages + 1):
-            # print(f'Now extracting from Page {page_num} of Feature: '
-            #       f'{feature_and_url[CFG.FEATURE_INDEX]} ')
-            logging.info(f'Now extracting from Page {page_num} of '
-                         f'Feature:{feature_and_url[CFG.FEATURE_INDEX]}')
-            new_url = feature_and_url[CFG.URL_INDEX] \
-                .replace(f'page={current_page}', f'page={page_num}')
-            new_page_soup = Features.make_soup(new_url)
-            all_product_info = Features.find_all_products(new_page_soup)
-            current_page = Features.process_product(all_product_info, product_names,
-                                                    feature_and_url)
+    def process_additional_page_products(additional_pages, **kwargs):
+        """
+        This function processes the pages 2..N of all the features that have
+        more than 1 page in one concurrent wave. Pages are downloaded and parsed
+        by a pool of as many workers as pages are downloaded at the same time
+        (--concurrency), and their product names are appended to the list of
+        their feature in page order
+        """
+        from gevent.pool import Pool
+        concurrency = CFG.CONCURRENCY if kwargs.get('concurrency') is None \
+            else kwargs['concurrency']
+        pages_products = Pool(concurrency).imap(
+            lambda page: Features.get_page_products(*page), additional_pages)
+        for (feature_and_url, _), product_names in zip(additional_pages, pages_products):
+            feature_and_url[CFG.PRODUCT_INDEX].extend(product_names)
 
     @staticmethod
-    def process_feature(rs, index, unavailable_pages, feature_and_url,
-                        feature_dict):
+    def process_feature(source_code, unavailable_pages, feature_and_url, feature_dict):
         """
-        This function calls various functions to process a feature found
-        in the html script.
+        This function calls various functions to process the first page of a
+        feature found in the html script.
         It uses other functions to append product names to lists of
-        features. Once all the pages of a feature have been scrapped and
-        all product names have been added to that feature, the information
-        is stored in a dictionary with key = features and value = list of
-        products corresponding to that feature.
+        features, and the information is stored in a dictionary with
+        key = features and value = list of products corresponding to that
+        feature. source_code is the html of the first page (None if it could not
+        be downloaded). It returns the urls of the remaining pages of the feature,
+        whose products are added later to the same list.
         """
+        import parsing
         product_names = []
+        additional_pages = []
 
-        if rs[index] is None:
+        if source_code is None:
             logging.error('webpage unavailable')
             unavailable_pages += 1
         else:
-            soup = BeautifulSoup(rs[index].text, 'html.parser')
-            num_pages = Features.get_num_pages(soup)
+            with metrics.timer('parse_seconds'):
+                soup = parsing.make_soup(source_code, parsing.PRODUCTS_GRID)
+                num_pages = Features.get_num_pages(soup)
+                product_names = Features.extract_page_products(soup)
             current_page = int(re.search('page=(\d)',
                                          feature_and_url[CFG.URL_INDEX]).group(1))
-            # print(f'Now extracting from Page 1 of Feature: '
-            #       f'{feature_and_url[CFG.FEATURE_INDEX]}')
             logging.info(f'Now extracting from Page 1 of Feature: '
                          f'{feature_and_url[CFG.FEATURE_INDEX]}')
 
-            all_product_info = Features.find_all_products(soup)
-            Features.process_first_page_product(all_product_info, product_names)
-
-            if num_pages > 1:
-                Features.process_additional_page_products(num_pages, feature_and_url,
-                                                          product_names, current_page)
+            additional_pages = [(feature_and_url,
+                                 feature_and_url[CFG.URL_INDEX]
+                                 .replace(f'page={current_page}', f'page={page_num}'))
+                                for page_num in range(current_page + 1, num_pages + 1)]
 
             feature_and_url.append(product_names)
             feature_dict[feature_and_url[CFG.FEATURE_INDEX]] = product_names
-            # print(feature_and_url)
-            # print(f'products in {feature_and_url[CFG.FEATURE_INDEX]} feature: '
-            #       f'{len(feature_and_url[CFG.PRODUCT_INDEX])}')
+        return additional_pages
 
     @staticmethod
-    def get_information():
+    def get_information(**kwargs):
         """
         This function is the top level function for executing all other
         feature functions. It calls get_features() to extract all features
         from the homepage html script. It then calls process_features()
-        to extract all products corresponding to every feature. Once
-        completed, it will create a csv file with the features and
-        corresponding products
+        to extract all products corresponding to every feature (with
+        --engine async, both steps are done by the asyncio engine). Once
+        completed, it will write the features store (features.csv) with a
+        row for each feature and each of its products
         """
-        print('Extracting features...')
+        print('Extracting features...', file=sys.stderr)
         logging.info('Extracting features')
-        features_and_urls = \
-            Features.get_features(CFG.URL_FIRST_PART
-            + CFG.URL_SECOND_PART_FIRST_TIME
-            + CFG.URL_PAGE_TAG)
-        features_info = Features.process_features(features_and_urls)
-        dict_file = open('features.csv', 'w')
-        writer = csv.writer(dict_file)
-        for feature, plants in features_info.items():
-            # print(feature, plants)
-            writer.writerow([feature, plants])
-        dict_file.close()
+        if kwargs.get('engine') == 'async':
+            import async_engine
+            features_info = async_engine.get_crawler().crawl_features()
+        else:
+            features_and_urls = \
+                Features.get_features(CFG.URL_FIRST_PART
+                + CFG.URL_SECOND_PART_FIRST_TIME
+                + CFG.URL_PAGE_TAG)
+            features_info = Features.process_features(features_and_urls, **kwargs)
+        Features.write_features(features_info)
 
     @staticmethod
-    def process_features(feature_url_list):
-        """
-        This function uses grequests to request html scripts of all
-        features. After iterating through every feature and all pages of
-        each feature, it returns a finalized dictionary with each feature
-        and a list of products corresponding to that feature
-        """
-        rs = (grequests.get(feature_and_url[CFG.URL_INDEX])
-              for feature_and_url in feature_url_list)
-        rs = grequests.map(rs, size=CFG.BATCH_SIZE)
+    def process_features(feature_url_list, **kwargs):
+        """
+        This function uses the URL frontier to request html scripts of all
+        features concurrently. The remaining pages of all the features are then
+        requested in a single concurrent wave. After iterating through every feature
+        and all pages of each feature, it returns a finalized dictionary with each feature
+        and a list of products corresponding to that feature. Features already
+        completed by a previous crawl are taken from the checkpoint instead. Pages
+        that could not be downloaded (or did not answer 200) are disregarded.
+        """
+        import frontier
+        import fetcher
+        completed_features = [checkpoint.get(CFG.CHECKPOINT_FEATURES,
+                                             feature_and_url[CFG.FEATURE_INDEX])
+                              for feature_and_url in feature_url_list]
+        pending_indexes = [index for index, products in enumerate(completed_features)
+                           if products is None]
+        rs = [None] * len(feature_url_list)
+        pending_pages = frontier.get_frontier().get_all([feature_url_list[index][CFG.URL_INDEX]
+                                                         for index in pending_indexes],
+                                                        CFG.FEATURE_PRIORITY)
+        for index, web_page in zip(pending_indexes, pending_pages):
+            rs[index] = fetcher.get_content(web_page)
 
         unavailable_pages = 0
         feature_dict = {}
 
+        additional_pages = []
         for index, feature_and_url in enumerate(feature_url_list):
-            Features.process_feature(rs, index, unavailable_pages, feature_and_url,
-                                     feature_dict)
+            if completed_features[index] is not None:
+                feature_dict[feature_and_url[CFG.FEATURE_INDEX]] = completed_features[index]
+                continue
+            additional_pages.extend(Features.process_feature(rs[index], unavailable_pages,
+                                                             feature_and_url, feature_dict))
+        Features.process_additional_page_products(additional_pages, **kwargs)
+
+        for index in pending_indexes:
+            feature = feature_url_list[index][CFG.FEATURE_INDEX]
+            if feature in feature_dict:
+                checkpoint.add(CFG.CHECKPOINT_FEATURES, feature, feature_dict[feature])
         # print('*******************************************************')
         # print(f'scraper encountered {unavailable_pages} unavailable features pages')
         # print('*******************************************************')
-        print('Features extracted!')
+        print('Features extracted!', file=sys.stderr)
         logging.info('Features extracted')
 
         return feature_dict
@@ -433,14 +527,19 @@ class Features:
     def create_api_dict():
         """
         This function sends a request to the growstuff.org api and returns a dictionary of crops and
-        their corresponding features.
+        their corresponding features (empty if the api could not be reached).
         """
+        import fetcher
+        import requests
 
         logging.info('Retrieving API info')
 
         api_dict = {}
-        api = 'https://www.growstuff.org/api/v1/crops'
-        response = requests.get(api)
+        response = fetcher.get(CFG.API_ADDRESS)
+        if response is None or response.status_code != requests.codes.ok:
+            print('could not retrieve the API info', file=sys.stderr)
+            logging.error(f'Could not download {CFG.API_ADDRESS}, API info disregarded')
+            return api_dict
         for entry in response.json().get('data'):
             if entry.get('attributes').get('perennial') is False:
                 feature = 'no feature'
@@ -456,45 +555,33 @@ class Features:
     def api_features_to_sql(api_info):
         """
         This function take a dictionary with crops and their features and inserts the data into the
-        tables relevant to features in the SQL database that has already been created.
+        tables relevant to features in the SQL database that has already been created. Features are
+        matched by feature_name (and pairs by feature and type_name), so only the new ones are
+        inserted (marked as from_api) and the others keep their ids.
         """
+        import db_func
 
         logging.info('Updating database with features API info')
-        connection = pymysql.connect(host=CFG.SQL_HOST,
-                                     user=CFG.SQL_USER,
-                                     password=CFG.SQL_PASS,
-                                     db=CFG.SQL_DB,
-                                     charset=CFG.SQL_CHARSET,
-                                     cursorclass=pymysql.cursors.DictCursor
-                                     )
-        cursor = connection.cursor()
-        connection.commit()
-
-        sql_count_features = """ Select count(*) from features"""
-        cursor.execute(sql_count_features)
-        feature_counts = cursor.fetchall()[0].get('count(*)')
-
-        new_features = set([value for value in api_info.values()])
-        for feature in new_features:
-            try:
-                with connection.cursor() as cursor:
-                    sql_feature = """ INSERT INTO features VALUES (%s, %s)"""
-                    cursor.execute(sql_feature, (feature_counts, feature))
-                connection.commit()
-            except Exception:
-                pass
-
-            for product in api_info.keys():
-                if api_info.get(product) == feature:
-                    try:
-                        with connection.cursor() as cursor:
-                            sql_feature_prod_join = \
-                                """ INSERT INTO features_prod_join VALUES (%s, %s)"""
-                            cursor.execute(sql_feature_prod_join, (feature_counts, product))
-                        connection.commit()
-                    except Exception:
-                        pass
-            feature_counts += 1
+        connection = db_func.connect()
+        feature_ids = {row['feature_name']: row['feature_id']
+                       for row in db_func.fetch_rows(connection, 'features',
+                                                     ['feature_id', 'feature_name'])}
+        current_pairs = {(row['feature_id'], row['type_name'])
+                         for row in db_func.fetch_rows(connection, 'features_prod_join',
+                                                       ['feature_id', 'type_name'])}
+
+        features_rows = []
+        feature_id = db_func.next_id(connection, 'features', 'feature_id')
+        for feature in sorted(set(api_info.values())):
+            if feature not in feature_ids:
+                feature_ids[feature] = feature_id
+                features_rows.append((feature_id, feature, True))
+                feature_id += 1
+        features_prod_join_rows = [(feature_ids[feature], product, True)
+                                   for product, feature in api_info.items()
+                                   if (feature_ids[feature], product) not in current_pairs]
+        db_func.insert_rows(connection, 'features', features_rows)
+        db_func.insert_rows(connection, 'features_prod_join', features_prod_join_rows)
 
         logging.info('Feature api update completed')
         connection.close()
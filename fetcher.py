@@ -0,0 +1,221 @@
+"""
+Authors: Isaac Misri, Sergio Drajner
+Description: This script contains the HTTP session shared by all the functions
+that download pages, so that connections are kept alive and reused during the
+whole scraping process instead of opening a new one for each page. Pages go
+through the response cache unless it is disabled, and every request goes
+through the shared rate limiter. How a page is downloaded (cache, rate
+limiter, retries) is decided by download, whatever the engine that sends the
+requests.
+"""
+import time
+import logging
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from response_cache import ResponseCache
+from rate_limiter import RateLimiter
+import web_scraper_config as CFG
+import metrics
+
+HEADERS = {'User-Agent': CFG.USER_AGENT,
+           'Accept-Encoding': 'gzip, deflate',
+           'Connection': 'keep-alive'}
+SEND = 'send'
+WAIT = 'wait'
+
+session = None
+cache = None
+limiter = None
+timeout = (CFG.CONNECT_TIMEOUT, CFG.READ_TIMEOUT)
+attempts = CFG.ATTEMPTS
+wait_time = CFG.WAIT_TIME
+
+
+def configure(**kwargs):
+    """
+    Creates the shared session with a connection pool large enough for the
+    pages that are downloaded at the same time, sets the timeouts and the
+    retries, creates the rate limiter and opens the response cache (unless
+    --no-cache was chosen).
+    :param kwargs: parameters received from the CLI
+    :return:
+    """
+    global session, cache, limiter, timeout, attempts, wait_time
+    read_timeout = CFG.READ_TIMEOUT if kwargs.get('timeout') is None else kwargs['timeout']
+    concurrency = CFG.CONCURRENCY if kwargs.get('concurrency') is None else kwargs['concurrency']
+    timeout = (CFG.CONNECT_TIMEOUT, read_timeout)
+    attempts = CFG.ATTEMPTS if kwargs.get('retries') is None else kwargs['retries']
+    wait_time = CFG.WAIT_TIME if kwargs.get('sleep') is None else kwargs['sleep']
+    limiter = RateLimiter(CFG.RATE if kwargs.get('rate') is None else kwargs['rate'],
+                          CFG.BURST if kwargs.get('burst') is None else kwargs['burst'],
+                          concurrency)
+    adapter = HTTPAdapter(pool_connections=CFG.POOL_CONNECTIONS,
+                          pool_maxsize=max(concurrency, CFG.BATCH_SIZE),
+                          pool_block=True)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers.update(HEADERS)
+    cache = ResponseCache(CFG.CACHE_DIRECTORY, CFG.CACHE_MAX_SIZE, CFG.CACHE_TTL,
+                          CFG.CACHE_LOW_WATER) \
+        if kwargs.get('cache', True) else None
+
+
+def get_session():
+    """
+    :return: session: the shared requests session (created on first use)
+    """
+    if session is None:
+        configure()
+    return session
+
+
+def get_limiter():
+    """
+    :return: limiter: the shared rate limiter (created on first use)
+    """
+    if limiter is None:
+        configure()
+    return limiter
+
+
+def get(url):
+    """
+    Downloads the page of the given url using the shared session (see download).
+    :param url: string
+    :return: web_page: response object, or None if the page could not be downloaded
+    """
+    steps = download(url)
+    reply = None
+    try:
+        while True:
+            step, value = steps.send(reply)
+            if step == SEND:
+                reply = send(url, value)
+            else:
+                time.sleep(value)
+                reply = None
+    except StopIteration as stop:
+        return stop.value
+
+
+def send(url, headers):
+    """
+    Sends a request for the page of the given url using the shared session.
+    :param url: string
+    :param headers: dictionary with the headers of the request
+    :return: web_page: response object, or None if the request failed
+    """
+    try:
+        return get_session().get(url, timeout=timeout, headers=headers)
+    except requests.exceptions.RequestException as error:
+        logging.error(f'Could not download {url}: {error}')
+        return None
+
+
+def download(url):
+    """
+    Decides how the page of the given url is downloaded, so that every engine
+    downloads the pages in the same way and only sends the requests. Cached
+    pages are returned directly while they are fresh, and revalidated with a
+    conditional request otherwise. Every request waits for the shared rate
+    limiter. Requests that fail with a connection error, too many requests or
+    a server error are retried up to attempts times, waiting an exponential
+    backoff (or the Retry-After of the server) in between. If the download
+    still fails, the cached page (if any) is returned instead.
+    This is a generator of the steps the engine has to take: (SEND, headers)
+    to send a request with these headers, and send back its response object
+    (None if the request failed), or (WAIT, seconds) to wait.
+    :param url: string
+    :return: web_page: response object, or None if the page could not be downloaded
+    """
+    cached = cache.lookup(url) if cache is not None else None
+    if cached is not None and cache.is_fresh(cached[CFG.META_INDEX]):
+        metrics.increment('cache_hits')
+        return make_response(url, *cached)
+    headers = ResponseCache.get_conditional_headers(cached[CFG.META_INDEX]) \
+        if cached is not None else {}
+    web_page = None
+    for attempt in range(attempts):
+        limiter_wait = get_limiter().reserve()
+        while limiter_wait > 0:
+            yield WAIT, limiter_wait
+            limiter_wait = get_limiter().reserve()
+        retry_after = None
+        metrics.increment('requests')
+        if attempt > 0:
+            metrics.increment('retries')
+        start = time.perf_counter()
+        web_page = yield SEND, headers
+        metrics.observe('fetch_seconds', time.perf_counter() - start)
+        if web_page is None:
+            failed = True
+        else:
+            metrics.increment('bytes_downloaded', len(web_page.content))
+            failed = RateLimiter.is_retryable(web_page.status_code)
+            if failed:
+                retry_after = RateLimiter.parse_retry_after(web_page.headers.get('Retry-After'))
+                logging.error(f'Could not download {url}: status {web_page.status_code}')
+        get_limiter().release(failed, retry_after)
+        if not failed:
+            break
+        if attempt < attempts - 1:
+            backoff = RateLimiter.get_backoff(attempt, wait_time, retry_after)
+            logging.info(f"\tAttempting {attempts - attempt - 1} more time"
+                         f"{'s' if attempts - attempt - 1 > 1 else ''} in {backoff:.1f} seconds")
+            yield WAIT, backoff
+    if web_page is None or RateLimiter.is_retryable(web_page.status_code):
+        metrics.increment('failed_downloads')
+        return make_response(url, *cached) if cached is not None else web_page
+    if cached is not None and web_page.status_code == requests.codes.not_modified:
+        cache.refresh(url, cached[CFG.META_INDEX])
+        metrics.increment('cache_revalidations')
+        return make_response(url, *cached)
+    if cache is not None and web_page.status_code == requests.codes.ok:
+        cache.store(url, web_page.headers, web_page.content, web_page.encoding)
+    return web_page
+
+
+def get_content(web_page):
+    """
+    :param web_page: response object, or None
+    :return: content: bytes, or None if the page could not be downloaded or
+    did not answer 200 (then it is considered unavailable)
+    """
+    if web_page is None or web_page.status_code != requests.codes.ok:
+        return None
+    return web_page.content
+
+
+def make_response(url, meta, body):
+    """
+    Builds a response object from a cached entry, so that callers can use it
+    exactly as a downloaded page.
+    :param url: string
+    :param meta: dictionary - information of the cached entry
+    :param body: bytes - cached content
+    :return: web_page: response object
+    """
+    return build_response(url, requests.codes.ok, {'Content-Type': meta.get('content_type') or ''},
+                          body, meta.get('encoding'))
+
+
+def build_response(url, status_code, headers, content, encoding):
+    """
+    Builds a response object, so that the responses of every engine (and the
+    cached entries) are used in the same way.
+    :param url: string
+    :param status_code: int
+    :param headers: headers of the response
+    :param content: bytes
+    :param encoding: string - encoding of the content, or None
+    :return: web_page: response object
+    """
+    web_page = requests.Response()
+    web_page.url = url
+    web_page.status_code = status_code
+    web_page.headers = CaseInsensitiveDict(headers)
+    web_page.encoding = encoding
+    web_page._content = content
+    return web_page
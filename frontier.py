@@ -0,0 +1,123 @@
+"""
+Authors: Isaac Misri, Sergio Drajner
+Description: This script contains the URL frontier through which the gevent
+engine downloads every page of the crawl. Each distinct page is downloaded
+and parsed only once per run, however many listing pages and features refer
+to it (see scheduler.py), and listing pages are downloaded before feature
+pages and option pages.
+"""
+import logging
+import gevent
+from gevent.event import AsyncResult
+from gevent.queue import PriorityQueue
+import web_scraper_config as CFG
+from scheduler import Scheduler
+import fetcher
+
+frontier = None
+
+
+class Frontier(Scheduler):
+    """
+    This is the class related to the URL frontier. Requested pages are queued
+    by priority (the lower, the sooner) and downloaded by size workers, and
+    kept as described in Scheduler.
+    """
+    def __init__(self, size):
+        """
+        Constructor for Frontier.
+        :param size: int - number of pages downloaded at the same time
+        """
+        super().__init__()
+        self.queue = PriorityQueue()
+        self.workers = [gevent.spawn(self.work) for _ in range(size)]
+
+    def create_result(self):
+        """
+        :return: result: AsyncResult with the response of the page
+        """
+        return AsyncResult()
+
+    def enqueue(self, item):
+        """
+        Queues a page for the workers.
+        :param item: (priority, order, url, result)
+        :return:
+        """
+        self.queue.put(item)
+
+    def work(self):
+        """
+        Downloads the queued pages, one after the other.
+        :return:
+        """
+        while True:
+            _, _, url, result = self.queue.get()
+            try:
+                web_page = fetcher.get(url)
+            except Exception as error:
+                logging.error(f'Could not download {url}: {error}')
+                web_page = None
+            self.downloaded(url, result, web_page)
+            result.set(web_page)
+
+    def get(self, url, priority):
+        """
+        :param url: string
+        :param priority: int - priority of the page
+        :return: web_page: response object of the page, or None if it could not be downloaded
+        """
+        result = self.request(url, priority)
+        web_page = result.get()
+        self.release(url, result)
+        return web_page
+
+    def get_all(self, urls, priority):
+        """
+        :param urls: list of strings
+        :param priority: int - priority of the pages
+        :return: web_pages: list of response objects (or None), in the order of the urls
+        """
+        results = [self.request(url, priority) for url in urls]
+        web_pages = [result.get() for result in results]
+        for url, result in zip(urls, results):
+            self.release(url, result)
+        return web_pages
+
+    def parse(self, url, priority, parse_function, *args, keep=True):
+        """
+        Returns the result of parse_function for the content of a page (and
+        args). Each page is parsed only once by each parse_function, unless
+        its result is not kept.
+        :param url: string
+        :param priority: int - priority of the page
+        :param parse_function: function that takes the content of the page and args
+        :param args: other arguments of parse_function
+        :param keep: bool - False not to keep the result once it is returned
+        :return: the result of parse_function, or None if the page could not be downloaded
+        """
+        key = self.get_key(url, parse_function, args)
+        if key in self.parsed:
+            return self.parsed[key]
+        return self.parse_page(key, self.get(url, priority), parse_function, args, keep)
+
+
+def configure(**kwargs):
+    """
+    Creates the frontier, with as many workers as pages are downloaded at the
+    same time.
+    :param kwargs: parameters received from the CLI
+    :return:
+    """
+    global frontier
+    frontier = Frontier(CFG.CONCURRENCY if kwargs.get('concurrency') is None
+                        else kwargs['concurrency'])
+
+
+def get_frontier():
+    """
+    :return: frontier: the URL frontier (created on first use)
+    """
+    if frontier is None:
+        configure()
+    return frontier
@@ -0,0 +1,190 @@
+"""
+Authors: Isaac Misri, Sergio Drajner
+Description: This script contains the metrics of the scraping process. Each
+stage (features, products, output, enrich) collects counters (requests,
+retries, cache hits, bytes downloaded, rows produced, rows written to the
+database...) and histograms of durations (fetch latency, parse time, database
+write time). At the end of the run they are written as a JSON summary and,
+optionally, in the Prometheus text format.
+"""
+import json
+import time
+import bisect
+import logging
+from contextlib import contextmanager
+import web_scraper_config as CFG
+
+stages = {}
+current_stage = None
+
+
+class Histogram:
+    """
+    This is the class related to a histogram of durations, with the buckets
+    of CFG.LATENCY_BUCKETS (in seconds).
+    """
+    def __init__(self):
+        """
+        Constructor for Histogram.
+        """
+        self.buckets = [0] * (len(CFG.LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        """
+        :param seconds: float - duration to add to the histogram
+        :return:
+        """
+        self.buckets[bisect.bisect_left(CFG.LATENCY_BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+
+    def get_cumulative_buckets(self):
+        """
+        :return: list of (upper bound, number of durations up to it), the last
+        bound being '+Inf'
+        """
+        bounds = [str(bound) for bound in CFG.LATENCY_BUCKETS] + ['+Inf']
+        cumulative = []
+        total = 0
+        for bound, count in zip(bounds, self.buckets):
+            total += count
+            cumulative.append((bound, total))
+        return cumulative
+
+    def to_dict(self):
+        """
+        :return: dictionary with the count, sum, mean, max and cumulative buckets
+        """
+        return {'count': self.count,
+                'sum': round(self.sum, 6),
+                'mean': round(self.sum / self.count, 6) if self.count else 0,
+                'max': round(self.max, 6),
+                'buckets': dict(self.get_cumulative_buckets())}
+
+
+def get_stage(name=None):
+    """
+    :param name: string - name of the stage (default: the current stage)
+    :return: dictionary with the duration, counters and histograms of the stage
+    """
+    name = name or current_stage or 'main'
+    if name not in stages:
+        stages[name] = {'seconds': 0.0, 'counters': {}, 'histograms': {}}
+    return stages[name]
+
+
+@contextmanager
+def stage(name):
+    """
+    Measures a stage: the metrics collected inside the block are added to it.
+    :param name: string - name of the stage
+    :return:
+    """
+    global current_stage
+    previous_stage = current_stage
+    current_stage = name
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        get_stage(name)['seconds'] += time.perf_counter() - start
+        current_stage = previous_stage
+
+
+def increment(name, value=1):
+    """
+    Adds value to a counter of the current stage.
+    :param name: string - name of the counter
+    :param value: int
+    :return:
+    """
+    counters = get_stage()['counters']
+    counters[name] = counters.get(name, 0) + value
+
+
+def observe(name, seconds):
+    """
+    Adds a duration to a histogram of the current stage.
+    :param name: string - name of the histogram
+    :param seconds: float
+    :return:
+    """
+    histograms = get_stage()['histograms']
+    if name not in histograms:
+        histograms[name] = Histogram()
+    histograms[name].observe(seconds)
+
+
+@contextmanager
+def timer(name):
+    """
+    Adds the duration of the block to a histogram of the current stage.
+    :param name: string - name of the histogram
+    :return:
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start)
+
+
+def get_summary():
+    """
+    :return: dictionary with the metrics of every stage
+    """
+    return {name: {'seconds': round(metrics['seconds'], 6),
+                   'counters': dict(metrics['counters']),
+                   'histograms': {histogram_name: histogram.to_dict() for histogram_name, histogram
+                                  in metrics['histograms'].items()}}
+            for name, metrics in stages.items()}
+
+
+def write_summary(file_name):
+    """
+    Writes the metrics of every stage to a JSON file and to the log.
+    :param file_name: string
+    :return:
+    """
+    summary = get_summary()
+    with open(file_name, 'w') as summary_file:
+        json.dump(summary, summary_file, indent=4)
+    logging.info(f'Metrics: {json.dumps(summary)}')
+
+
+def write_prometheus(file_name):
+    """
+    Writes the metrics of every stage to a file in the Prometheus text format,
+    with the stage as a label.
+    :param file_name: string
+    :return:
+    """
+    lines = [f'# TYPE {CFG.METRICS_PREFIX}_stage_seconds gauge']
+    lines += [f'{CFG.METRICS_PREFIX}_stage_seconds{{stage="{name}"}} {metrics["seconds"]}'
+              for name, metrics in stages.items()]
+    counter_names = sorted({counter for metrics in stages.values()
+                            for counter in metrics['counters']})
+    for counter in counter_names:
+        lines.append(f'# TYPE {CFG.METRICS_PREFIX}_{counter}_total counter')
+        lines += [f'{CFG.METRICS_PREFIX}_{counter}_total{{stage="{name}"}} '
+                  f'{metrics["counters"][counter]}'
+                  for name, metrics in stages.items() if counter in metrics['counters']]
+    histogram_names = sorted({histogram for metrics in stages.values()
+                              for histogram in metrics['histograms']})
+    for histogram_name in histogram_names:
+        metric = f'{CFG.METRICS_PREFIX}_{histogram_name}'
+        lines.append(f'# TYPE {metric} histogram')
+        for name, metrics in stages.items():
+            histogram = metrics['histograms'].get(histogram_name)
+            if histogram is None:
+                continue
+            lines += [f'{metric}_bucket{{stage="{name}",le="{bound}"}} {count}'
+                      for bound, count in histogram.get_cumulative_buckets()]
+            lines.append(f'{metric}_sum{{stage="{name}"}} {histogram.sum}')
+            lines.append(f'{metric}_count{{stage="{name}"}} {histogram.count}')
+    with open(file_name, 'w') as prometheus_file:
+        prometheus_file.write('\n'.join(lines) + '\n')
@@ -40,8 +40,8 @@ def output_result(features, products, **kwargs):
     :param kwargs: parameters to use for displaying and writing
     :return:
     """
-    pd.set_option("max_rows", None)
-    pd.set_option("max_colwidth", CFG.MAX_COLUMN_WIDTH)
+    pd.set_option("display.max_rows", None)
+    pd.set_option("display.max_colwidth", CFG.MAX_COLUMN_WIDTH)
     if kwargs['verbose']:
         if kwargs['break_down']:
             features.display_features(products)
@@ -51,8 +51,13 @@ def output_result(features, products, **kwargs):
     if kwargs['output'] is not None:
 
         if kwargs['output'].lower() == 'db':
-            products.fill_products_df()
-            features.fill_features_df()
+            if kwargs['db_mode'].lower() == 'replace':
+                products.fill_products_df()
+                features.fill_features_df()
+            else:
+                products.sync_products_df()
+                features.sync_features_df()
+            products.snapshot_products_df()
         else:
             features.output_features(**kwargs)
             products.output_products(**kwargs)
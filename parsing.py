@@ -0,0 +1,60 @@
+"""
+Authors: Isaac Misri, Sergio Drajner
+Description: This script contains the functions used to parse the downloaded
+pages. The parser backend is configurable (lxml when installed, html.parser
+otherwise) and pages can be restricted to the part of the tree that is needed.
+"""
+import logging
+from bs4 import BeautifulSoup, SoupStrainer, FeatureNotFound
+import web_scraper_config as CFG
+
+
+def has_any_class(*classes):
+    """
+    Given some classes, returns a function that tells if the class attribute
+    of a tag contains any of them, to be used in a SoupStrainer.
+    :param classes: strings
+    :return: function
+    """
+    def matches(value):
+        if value is None:
+            return False
+        tag_classes = value.split() if isinstance(value, str) else value
+        return any(tag_class in classes for tag_class in tag_classes)
+    return matches
+
+
+COLLECTION_SECTION = SoupStrainer(id='shopify-section-static-collection')
+PRODUCT_SECTION = SoupStrainer(id='shopify-section-static-product')
+FEATURES_LIST = SoupStrainer('li', class_=has_any_class('filter-item'))
+PRODUCTS_GRID = SoupStrainer(class_=has_any_class('productgrid--items', 'pagination--item'))
+
+parser = None
+
+
+def configure(**kwargs):
+    """
+    Chooses the parser backend, falling back to html.parser when the
+    requested one is not installed.
+    :param kwargs: parameters received from the CLI
+    :return:
+    """
+    global parser
+    parser = CFG.PARSER if kwargs.get('parser') is None else kwargs['parser']
+    try:
+        BeautifulSoup('', parser)
+    except FeatureNotFound:
+        logging.warning(f'Parser {parser} is not installed, using {CFG.FALLBACK_PARSER}')
+        parser = CFG.FALLBACK_PARSER
+
+
+def make_soup(markup, parse_only=None):
+    """
+    Given the markup of a page, returns its BeautifulSoup object.
+    :param markup: string or bytes - content of the page
+    :param parse_only: SoupStrainer - part of the page to be parsed (default: all)
+    :return: soup: BeautifulSoup object
+    """
+    if parser is None:
+        configure()
+    return BeautifulSoup(markup, parser, parse_only=parse_only)
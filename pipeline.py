@@ -0,0 +1,45 @@
+"""
+Authors: Isaac Misri, Sergio Drajner
+Description: This script contains the functions that connect the stages of the
+gevent crawl. Each stage is a generator that takes the items of the previous
+one; a buffered stage runs in its own greenlet and works ahead of the next
+stage through a bounded queue.
+"""
+import gevent
+from gevent.queue import Queue
+
+END = object()
+
+
+def buffered(items, size):
+    """
+    Runs the stage that produces items in its own greenlet, so that it keeps
+    working while the next stage handles the items already produced. At most
+    size items are kept waiting between the two stages; the stage waits for
+    the next one when the queue is full.
+    :param items: iterable (usually a generator) - the stage to run ahead
+    :param size: int - number of items that can be waiting in the queue
+    :return: generator of the items, in the same order
+    """
+    queue = Queue(size)
+
+    def produce():
+        try:
+            for item in items:
+                queue.put(item)
+        except gevent.GreenletExit:
+            raise
+        except Exception:
+            queue.put(END)
+            raise
+        queue.put(END)
+
+    producer = gevent.spawn(produce)
+    try:
+        item = queue.get()
+        while item is not END:
+            yield item
+            item = queue.get()
+        producer.get()
+    finally:
+        producer.kill()
@@ -3,14 +3,17 @@ Authors: Isaac Misri, Sergio Drajner
 Description: This script contains all the functions that are used to extract
 all product information for each product listed.
 """
+import re
 import sys
-import time
+import csv
+import datetime
 import logging
+import itertools
 import pandas as pd
-import requests
-from bs4 import BeautifulSoup
-import pymysql.cursors
 import web_scraper_config as CFG
+import checkpoint
+import metrics
+import profiling
 
 
 class Products:
@@ -30,16 +33,16 @@ class Products:
         :param kwargs: parameters received from the CLI
         :return: products_df: dataframe
         """
-        products_columns = ['Name', 'Type', 'Option', 'Price', 'Is Sold Out']
-        self.products_df = pd.DataFrame(columns=products_columns)
+        self.products_df = pd.DataFrame(columns=CFG.PRODUCTS_COLUMNS)
         if not kwargs['scrape']:
             self.products_df = self.process_input_file(features_and_products_df, **kwargs)
         else:
-            print('Extracting products...')
+            print('Extracting products...', file=sys.stderr)
             self.productsdf = self.process_pages(features_and_products_df, **kwargs)
-            print('Products extracted!')
+            print('Products extracted!', file=sys.stderr)
         self.products_df.set_index(['Name', 'Type', 'Option'], inplace=True)
 
+    @profiling.trace_memory('Products.process_input_file')
     def process_input_file(self, features_and_products_df, **kwargs):
         """
         Gets the file products.csv that was previously created as an input.
@@ -50,60 +53,173 @@ class Products:
         :param kwargs: parameters to be used for filtering
         :return: products_df: object dataframe
         """
-        try:
-            products_to_filter_df = pd.read_csv('products.csv')
-        except FileNotFoundError:
-            print('Error - Input file products.csv was not found in the current directory')
-            sys.exit(4)
-
-        products_to_filter_df.fillna("", inplace=True)
+        if (kwargs.get('input') or 'csv').lower() in CFG.COLUMNAR_FORMATS:
+            products_to_filter_df = Products.read_columnar_file(kwargs['input'].lower(),
+                                                                **kwargs)
+        else:
+            try:
+                products_to_filter_df = pd.read_csv('products.csv')
+            except FileNotFoundError:
+                print('Error - Input file products.csv was not found in the current directory')
+                sys.exit(4)
+            products_to_filter_df.fillna("", inplace=True)
         products_to_filter_df = \
             self.filter_products(products_to_filter_df,
                                  features_and_products_df,
                                  **kwargs)
-        self.products_df = self.products_df.append(products_to_filter_df)
+        self.products_df = products_to_filter_df.reindex(columns=CFG.PRODUCTS_COLUMNS)
         return self.products_df
 
+    @staticmethod
+    def read_columnar_file(file_format, **kwargs):
+        """
+        Reads the products from the products.parquet or products.feather file
+        that could have been created by this script before. Only the rows in
+        the price range and with the sold out status asked for are read. All
+        the columns are read, as every display and output uses all of them.
+        :param file_format: string - parquet or feather
+        :param kwargs: parameters to be used for filtering
+        :return: products_df: dataframe
+        """
+        import columnar
+        try:
+            products_df = columnar.read('products', file_format, CFG.PRODUCTS_COLUMNS,
+                                        columnar.get_products_filter(**kwargs))
+        except FileNotFoundError:
+            print(f'Error - Input file {columnar.get_file_name("products", file_format)} '
+                  f'was not found in the current directory')
+            sys.exit(4)
+        products_df['Price'] = products_df['Price'].astype(float).round(CFG.PRICE_DECIMALS)
+        return products_df
+
     def process_pages(self, features_and_products_df, **kwargs):
         """
         Processes the pages of the web site to scrape information, returns
-        the updated scraped information.
+        the updated scraped information. Pages already completed by a previous
+        crawl are taken from the checkpoint instead of being downloaded. With
+        --engine async, the pages are crawled by the asyncio engine instead.
+        With --stream, the products of each page are written as soon as its
+        options are downloaded, and neither the pages nor their products are
+        kept.
+        The gevent crawl is a pipeline of stages: the listing pages are
+        fetched (and their cards extracted), the options of their products are
+        sent to the pool of workers, and the rows of each page are collected
+        and then filtered and written, or kept. Fetching the listing pages and
+        sending their options runs ahead of the other stages, by up to
+        CFG.PIPELINE_QUEUE_SIZE pages.
         :param features_and_products_df: dataframe with filtered features and
         their partly filtered products (flattened).
         :param kwargs: parameters to be used for filtering
         :return: products_df: object dataframe
         """
+        self.write_page = self.open_stream(**kwargs) if kwargs.get('stream') else None
+        if kwargs.get('engine') == 'async':
+            import async_engine
+            stream_page = None if self.write_page is None else \
+                lambda url, listing_page, page_rows: self.stream_page(url, listing_page, page_rows,
+                                                                      features_and_products_df,
+                                                                      **kwargs)
+            pages, self.crawl_is_complete = async_engine.get_crawler().crawl_products(stream_page)
+            return self.collect_pages(pages, features_and_products_df, **kwargs)
+        from gevent.pool import Pool
+        import pipeline
+        concurrency = CFG.CONCURRENCY if kwargs['concurrency'] is None else kwargs['concurrency']
+        self.options_pool = Pool(concurrency)
+        self.crawl_is_complete = False
+        pages = self.fetch_listing_pages(**kwargs)
+        pages = self.expand_options(pages, **kwargs)
+        pages = pipeline.buffered(pages, CFG.PIPELINE_QUEUE_SIZE)
+        pages = Products.collect_options(pages)
+        return self.collect_pages(pages, features_and_products_df, **kwargs)
+
+    def fetch_listing_pages(self, **kwargs):
+        """
+        Fetches the listing pages in order (each one has the link to the next
+        one), and sets crawl_is_complete once the last one is fetched. When
+        the number of pages is known from the pagination, the following
+        CFG.LISTING_PREFETCH pages that are not in the checkpoint are requested
+        with each page, so that they are downloaded concurrently instead of
+        one after the other, without keeping the pages of the whole shop. With
+        --stream, the pages are added to the checkpoint once they are written
+        (see stream_page) instead.
+        :param kwargs: parameters received from the CLI
+        :return: generator of (url, listing_page) - see parse_listing_page
+        """
+        import frontier
         url_second_part = CFG.URL_SECOND_PART_FIRST_TIME
-        attempts = CFG.ATTEMPTS if kwargs['retries'] is None else kwargs['retries']
-        wait_time = CFG.WAIT_TIME if kwargs['sleep'] is None else kwargs['sleep']
-        while True and attempts > 0:
+        while True:
             url = CFG.URL_FIRST_PART + url_second_part
-            logging.info(f'Processing page {url}')
-            web_page = requests.get(url)
-            if web_page.status_code == requests.codes.ok:
-                soup = BeautifulSoup(web_page.content, 'html.parser')
-                page_products = soup.find(id="shopify-section-static-collection")
-                self.products_df = \
-                    self.process_products(page_products,
-                                          features_and_products_df,
-                                          **kwargs)
-                url_second_part = Products.get_next_url_second_part(page_products)
-                if url_second_part is None:
-                    break
-
-                else:
-                    attempts = CFG.ATTEMPTS if kwargs['retries'] is None else kwargs['retries']
-                    wait_time = CFG.WAIT_TIME if kwargs['sleep'] is None else kwargs['sleep']
-            else:
-                attempts -= 1
-                if attempts > 0:
-                    logging.info(f"\tAttempting {attempts} more time{'s' if attempts > 1 else ''}"
-                                 f" in {wait_time} second"
-                                 f"{'s' if wait_time != 1 else ''}")
-                    time.sleep(wait_time)
-                else:
+            listing_page = Products.get_completed_page(url, **kwargs)
+            if listing_page is None:
+                logging.info(f'Processing page {url}')
+                listing_page = frontier.get_frontier().parse(url, CFG.LISTING_PRIORITY,
+                                                             Products.parse_listing_page,
+                                                             keep=not kwargs.get('stream'))
+                if listing_page is None:
                     logging.error(f"Could not download page {url}. ")
-        return self.products_df
+                    print(f'Could not download page {url}. '
+                          f'Run again with --resume to continue from this page',
+                          file=sys.stderr)
+                    return
+                if not kwargs.get('stream'):
+                    checkpoint.add(CFG.CHECKPOINT_LISTING_PAGES, url, listing_page)
+            else:
+                logging.info(f'Page {url} taken from the checkpoint')
+            for listing_url in Products.get_listing_urls(listing_page, CFG.LISTING_PREFETCH):
+                if Products.get_completed_page(listing_url, **kwargs) is None:
+                    frontier.get_frontier().request(listing_url, CFG.LISTING_PRIORITY)
+            yield url, listing_page
+            url_second_part = listing_page['next']
+            if url_second_part is None:
+                self.crawl_is_complete = True
+                return
+
+    @staticmethod
+    def parse_listing_page(content):
+        """
+        Parses a listing page of the web site.
+        :param content: bytes - html of the page
+        :return: listing_page: dictionary with the rows of the products without
+        options, the [name, url] of the products with options, the second
+        part of the url of the next page (None if it is the last one) and the
+        number of listing pages given by the pagination
+        """
+        import parsing
+        from features_functions import Features
+        soup = parsing.make_soup(content, parsing.COLLECTION_SECTION)
+        page_products = soup.find(id="shopify-section-static-collection")
+        products_rows, options = Products.process_products(page_products)
+        next_url_second_part = Products.get_next_url_second_part(page_products)
+        try:
+            num_pages = Features.get_num_pages(page_products)
+        except ValueError:
+            num_pages = None
+        return {'rows': products_rows,
+                'options': options,
+                'next': next_url_second_part,
+                'pages': num_pages}
+
+    @staticmethod
+    def get_listing_urls(listing_page, count):
+        """
+        Given a listing page, returns the urls of the (at most count) listing
+        pages that follow it, up to the last one given by its pagination, so
+        that they can be requested at once instead of one after the other.
+        :param listing_page: dictionary (see parse_listing_page)
+        :param count: int - maximum number of urls
+        :return: urls: list of strings - empty if it is the last page, or if
+        the number of the next page or of the last page is not known
+        """
+        url_second_part = listing_page['next']
+        num_pages = listing_page.get('pages')
+        if url_second_part is None or num_pages is None:
+            return []
+        next_page = re.search(r'page=(\d+)', url_second_part)
+        if next_page is None:
+            return []
+        first_page = int(next_page.group(1))
+        return [CFG.URL_FIRST_PART + re.sub(r'page=\d+', f'page={page_num}', url_second_part)
+                for page_num in range(first_page, min(num_pages, first_page + count - 1) + 1)]
 
     @staticmethod
     def get_next_url_second_part(products):
@@ -161,130 +277,250 @@ class Products:
                                                         boolean_to_compare_2))
         return products_to_filter_df[products_filter]
 
-    def process_products(self, page_products, features_and_products_df, **kwargs):
+    @staticmethod
+    def process_products(page_products):
         """
-        Updates the products_df dataframe with all the products of a page
+        Extracts all the products of a page. Products without options are
+        returned as rows, while for products with options only their name
+        and url are returned, as their options are in their own page.
         :param page_products: bs4 object - raw information of products of a page
         to be used as input
+        :return: products_rows: list of dictionaries - products without options
+        :return: options: list of [name, url] - products with options
+        """
+        cards = [Products.extract_card(card) for card in page_products.select(".productitem")]
+        products_rows = [{'Name': card['Name'],
+                          'Price': card['Price'],
+                          'Is Sold Out': card['Is Sold Out']}
+                         for card in cards if not card['Has Options']]
+        options = [[card['Name'], card['Url']] for card in cards if card['Has Options']]
+        return products_rows, options
+
+    def expand_options(self, listing_pages, **kwargs):
+        """
+        Sends the pages of the products with options of every listing page to
+        the pool of workers, to be downloaded concurrently.
+        :param listing_pages: iterable of (url, listing_page)
+        :param kwargs: parameters to be used for downloading the options
+        :return: generator of (url, listing_page, options_jobs) - the jobs of
+        the products with options of every listing page
+        """
+        for url, listing_page in listing_pages:
+            options_jobs = [self.options_pool.spawn(Products.process_options,
+                                                    name, product_url, **kwargs)
+                            for name, product_url in listing_page['options']]
+            yield url, listing_page, options_jobs
+
+    @staticmethod
+    def collect_options(pages):
+        """
+        Waits for the options of every page to be downloaded, in the order of
+        the pages.
+        :param pages: iterable of (url, listing_page, options_jobs)
+        :return: generator of (url, listing_page, page_rows) - the rows of
+        every page (without and with options)
+        """
+        for url, listing_page, options_jobs in pages:
+            page_rows = list(listing_page['rows'])
+            for job in options_jobs:
+                page_rows.extend(job.get())
+            yield url, listing_page, page_rows
+
+    @staticmethod
+    def filter_page(products_rows, features_and_products_df, **kwargs):
+        """
+        :param products_rows: list of dictionaries - rows of the products
+        :param features_and_products_df: dataframe with filtered features and
+        their partly filtered products (flattened).
+        :param kwargs: parameters to be used for filtering
+        :return: products_df: dataframe with the rows that pass the filters
+        """
+        products_to_filter_df = pd.DataFrame(products_rows, columns=CFG.PRODUCTS_COLUMNS)
+        products_to_filter_df.fillna("", inplace=True)
+        return Products.filter_products(products_to_filter_df, features_and_products_df,
+                                        **kwargs)
+
+    def open_stream(self, **kwargs):
+        """
+        Opens the stream where the products are written as they are scraped:
+        products.csv, products.jsonl or the screen (as csv). When the crawl is
+        resumed, the products are added to those written before.
+        :param kwargs: parameters with the stream format
+        :return: write_page: function that writes the filtered products of a page
+        """
+        stream_format = kwargs['stream'].lower()
+        self.stream_file = sys.stdout if stream_format == 'stdout' \
+            else open(f'products.{stream_format}', 'a' if kwargs.get('resume') else 'w',
+                      newline='')
+        if stream_format != 'jsonl' and (self.stream_file is sys.stdout
+                                         or self.stream_file.tell() == 0):
+            csv.writer(self.stream_file, lineterminator='\n').writerow(CFG.PRODUCTS_COLUMNS)
+
+        def write_page(page_df):
+            if page_df.empty:
+                return
+            if stream_format == 'jsonl':
+                self.stream_file.write(page_df.to_json(orient='records', lines=True).rstrip('\n')
+                                       + '\n')
+            else:
+                page_df.to_csv(self.stream_file, header=False, index=False)
+            self.stream_file.flush()
+            metrics.increment('rows_streamed', len(page_df))
+        return write_page
+
+    @staticmethod
+    def extract_card(card):
+        """
+        Extracts all the information of a product from its card in a page.
+        :param card: bs4 object - raw information of a product (.productitem)
+        :return: dictionary with the name, url, price of the product and if it
+        has options and if it is sold out
+        """
+        title = card.select(".productitem--title")[CFG.LAST]
+        price_raw = card.select_one(".price--main").get_text().strip(CFG.CHARACTERS_TO_STRIP)
+        return {'Name': title.get_text().strip(CFG.CHARACTERS_TO_STRIP),
+                'Url': title.find('a', href=True)["href"],
+                'Price': float(price_raw[price_raw.rfind(CFG.CURRENCY_SIGN) + 1:]),
+                'Has Options': price_raw.find(CFG.HAS_OPTIONS) != CFG.NOT_FOUND,
+                'Is Sold Out': card.get_text().find('Sold out') != CFG.NOT_FOUND}
+
+    def collect_pages(self, pages, features_and_products_df, **kwargs):
+        """
+        Last stage of the crawl. With --stream, every page is written as soon
+        as it is collected (see stream_page), and products_df stays empty.
+        Otherwise, the rows of all the pages are gathered (keeping the
+        original order) and the products_df dataframe is built once from
+        them, so that the products that match several features keep the order
+        of the features.
+        :param pages: iterable of (url, listing_page, page_rows)
         :param features_and_products_df: dataframe with filtered features and
         their partly filtered products (flattened).
         :param kwargs: parameters to be used for filtering
         :return: products_df: object dataframe, updated
         """
-        filter_products_names = [name.get_text().strip(CFG.CHARACTERS_TO_STRIP)
-                                 for name in page_products.select(".productitem--title")]
-        filter_products_names = [filter_products_names[index]
-                                 for index in range(CFG.FIRST_VALID,
-                                                    len(filter_products_names),
-                                                    CFG.SKIP_INVALID)]
-        filter_products_urls = [product_url["href"]
-                                for product_url in page_products.select(".productitem--title a")]
-        filter_products_urls = [filter_products_urls[index]
-                                for index in range(CFG.FIRST_VALID,
-                                                   len(filter_products_urls),
-                                                   CFG.SKIP_INVALID)]
-
-        filter_products_prices_or_options_raw = \
-            [price_raw.get_text().strip(CFG.CHARACTERS_TO_STRIP)
-             for position, price_raw in enumerate(page_products.select(".price--main"))
-             if position % 2 == 0]  # remove duplicates
-        filter_have_options = [False
-                               if price_raw.find(CFG.HAS_OPTIONS) == CFG.NOT_FOUND
-                               else True
-                               for price_raw in filter_products_prices_or_options_raw]
-        filter_products_prices = [float(price_raw[price_raw.rfind(CFG.CURRENCY_SIGN) + 1::])
-                                  for price_raw in filter_products_prices_or_options_raw]
-        filter_products_items = [product_item.get_text()
-                                 for product_item in page_products.select(".productitem")]
-        filter_products_are_sold_out = [False
-                                        if check_if_sold_out.find('Sold out') == CFG.NOT_FOUND
-                                        else True
-                                        for check_if_sold_out in filter_products_items]
-        products_to_filter_df = \
-            pd.DataFrame(data={'Name': filter_products_names,
-                               'Price': filter_products_prices,
-                               'Is Sold Out': filter_products_are_sold_out},
-                         columns=['Name', 'Type', 'Option', 'Price', 'Is Sold Out'])
-        products_to_filter_df.drop(products_to_filter_df[filter_have_options].index, inplace=True)
-
-        for product in range(len(filter_have_options)):
-            if filter_have_options[product]:
-                products_to_filter_df = \
-                    self.process_options(filter_products_names[product],
-                                         filter_products_urls[product],
-                                         products_to_filter_df,
-                                         **kwargs)
-        products_to_filter_df = self.filter_products(products_to_filter_df,
-                                                     features_and_products_df,
-                                                     **kwargs)
-        self.products_df = \
-            self.products_df.append(products_to_filter_df, ignore_index=True)
-        self.products_df.fillna("", inplace=True)
+        if self.write_page is None:
+            products_rows = list(itertools.chain.from_iterable(page_rows
+                                                               for _, _, page_rows in pages))
+            self.build_products_df(products_rows, features_and_products_df, **kwargs)
+        else:
+            for url, listing_page, page_rows in pages:
+                self.stream_page(url, listing_page, page_rows, features_and_products_df,
+                                 **kwargs)
+            if self.stream_file is not sys.stdout:
+                self.stream_file.close()
+        if self.crawl_is_complete:
+            checkpoint.clear()
         return self.products_df
 
+    def stream_page(self, url, listing_page, page_rows, features_and_products_df, **kwargs):
+        """
+        Filters and writes the products of a listing page to the stream. The
+        page is then added to the checkpoint without its products (they are
+        already written), only with what is needed to go on with the crawl.
+        :param url: string - url of the listing page
+        :param listing_page: dictionary (see parse_listing_page)
+        :param page_rows: list of dictionaries - rows of the products of the page
+        :param features_and_products_df: dataframe with filtered features and
+        their partly filtered products (flattened).
+        :param kwargs: parameters to be used for filtering
+        :return:
+        """
+        self.write_page(Products.filter_page(page_rows, features_and_products_df, **kwargs))
+        checkpoint.add(CFG.CHECKPOINT_LISTING_PAGES, url,
+                       {'rows': [], 'options': [], 'next': listing_page['next'],
+                        'pages': listing_page.get('pages'), 'written': True})
+
     @staticmethod
-    def process_options(filter_product_name, filter_product_url, products_to_filter_df,
-                        **kwargs):
+    def get_completed_page(url, **kwargs):
+        """
+        :param url: string - url of a listing page
+        :param kwargs: parameters received from the CLI
+        :return: listing_page: the listing page taken from the checkpoint, or
+        None if it was not completed, or if its products were written by a
+        previous crawl with --stream and are needed now
         """
-        Updates the products_to_filter dataframe by adding the options
-        available to the products.
+        listing_page = checkpoint.get(CFG.CHECKPOINT_LISTING_PAGES, url)
+        if listing_page is not None and listing_page.get('written') and not kwargs.get('stream'):
+            return None
+        return listing_page
+
+    @profiling.trace_memory('Products.build_products_df')
+    def build_products_df(self, products_rows, features_and_products_df, **kwargs):
+        """
+        Builds the products_df dataframe from the scraped rows and filters it
+        in a single pass.
+        :param products_rows: list of dictionaries - rows of all the products
+        :param features_and_products_df: dataframe with filtered features and
+        their partly filtered products (flattened).
+        :param kwargs: parameters to be used for filtering
+        :return: products_df: object dataframe, updated
+        """
+        self.products_df = Products.filter_page(products_rows, features_and_products_df,
+                                                **kwargs).reset_index(drop=True)
+        return self.products_df
+
+    @staticmethod
+    def process_options(filter_product_name, filter_product_url, **kwargs):
+        """
+        Gets the rows of the options available to the product (from the
+        checkpoint if its page was already completed by a previous crawl).
+        With --stream, the rows are neither kept nor added to the checkpoint,
+        since their listing page is added once it is written.
         :param filter_product_name: name of the product to be updated
         :param filter_product_url: url of the product to find its options
-        :param products_to_filter_df: dataframe to be updated with
-        products and their options
-        :return: updated products_to_filter_df: dataframe
+        :param kwargs: parameters received from the CLI
+        :return: products_rows: list of dictionaries, one per option
         """
+        import frontier
         url = CFG.URL_FIRST_PART + filter_product_url
+        products_rows = checkpoint.get(CFG.CHECKPOINT_OPTION_PAGES, url)
+        if products_rows is not None:
+            logging.info(f'Product page {url} taken from the checkpoint')
+            return products_rows
         logging.info(f'Processing product page {url} (with options)')
-        attempts = CFG.ATTEMPTS if kwargs['retries'] is None else kwargs['retries']
-        wait_time = CFG.WAIT_TIME if kwargs['sleep'] is None else kwargs['sleep']
-        page_is_ok = False
-        while attempts > 0:
-            web_page = requests.get(url)
-            if web_page.status_code == requests.codes.ok:
-                page_is_ok = True
-                soup = BeautifulSoup(web_page.content, 'html.parser')
-                options = soup.find(id="shopify-section-static-product")
-                options_types = Products.get_options_types(options)
-                options_info = \
-                    [option_info.get_text().strip(CFG.CHARACTERS_TO_STRIP).split(CFG.NEW_LINE)
-                     for option_info in options.select("select", name="id")]
-                for index in range(CFG.FIRST, len(options_info[CFG.FIRST]), CFG.IGNORE):
-                    option_info = options_info[CFG.FIRST][index].strip()
-                    products_to_filter_df = \
-                        Products.process_option(option_info, filter_product_name, options_types,
-                                                products_to_filter_df)
-                break
-
-            else:
-                attempts -= 1
-                if attempts > 0:
-                    logging.info(f"\tAttempting {attempts} more time"
-                                 f"{'s' if attempts > 1 else ''}"
-                                 f" in {wait_time} second"
-                                 f"{'s' if wait_time != 1 else ''}"
-                                 )
-                    time.sleep(wait_time)
-                else:
-                    logging.error(f"Could not download product page {url}. ")
-        if not page_is_ok:
+        products_rows = frontier.get_frontier().parse(url, CFG.OPTION_PRIORITY,
+                                                      Products.parse_options_page,
+                                                      filter_product_name,
+                                                      keep=not kwargs.get('stream'))
+        if products_rows is None:
+            logging.error(f"Could not download product page {url}. ")
             logging.error(f'Product {filter_product_name} disregarded')
-        return products_to_filter_df
+            return []
+        if not kwargs.get('stream'):
+            checkpoint.add(CFG.CHECKPOINT_OPTION_PAGES, url, products_rows)
+        return products_rows
 
     @staticmethod
-    def process_option(option_info, filter_product_name, options_types,
-                       products_to_filter_df):
+    def parse_options_page(content, filter_product_name):
+        """
+        Parses the page of a product with options.
+        :param content: bytes - html of the page
+        :param filter_product_name: name of the product of the page
+        :return: products_rows: list of dictionaries, one per option
         """
-        Processes the option of a product in the web site, and updates the
-        dataframe that contains the products to filter with the product and
-        the option's name, type, price and if it is sold out.
+        import parsing
+        soup = parsing.make_soup(content, parsing.PRODUCT_SECTION)
+        options = soup.find(id="shopify-section-static-product")
+        options_types = Products.get_options_types(options)
+        options_info = [option_info.get_text().strip(CFG.CHARACTERS_TO_STRIP).split(CFG.NEW_LINE)
+                        for option_info in options.select("select", name="id")]
+        return [Products.process_option(options_info[CFG.FIRST][index].strip(),
+                                        filter_product_name,
+                                        options_types)
+                for index in range(CFG.FIRST, len(options_info[CFG.FIRST]), CFG.IGNORE)]
+
+    @staticmethod
+    def process_option(option_info, filter_product_name, options_types):
+        """
+        Processes the option of a product in the web site, and returns the
+        row of the products to filter with the product and the option's
+        name, type, price and if it is sold out.
         :param option_info: raw information about the option of a product
         :param filter_product_name: string - names of the product with
         options to be updated
         :param options_types: string - types of the options of the product to
         be updated
-        :param products_to_filter_df: dataframe of the products to filter
-        :return: products_to_filter_df: updated dataframe
+        :return: product_row: dictionary
         """
         if option_info.find('sold_out') == CFG.NOT_FOUND:
             option_price = \
@@ -295,13 +531,11 @@ class Products:
             option_price = float(CFG.NO_PRICE)
             option_is_sold_out = True
 
-        products_to_filter_df = products_to_filter_df.\
-            append([{'Name': filter_product_name,
-                     'Type': options_types,
-                     'Option': option_info[:option_info.find(CFG.SEPARATOR)],
-                     'Price': option_price,
-                     'Is Sold Out': option_is_sold_out}], ignore_index=True)
-        return products_to_filter_df
+        return {'Name': filter_product_name,
+                'Type': options_types,
+                'Option': option_info[:option_info.find(CFG.SEPARATOR)],
+                'Price': option_price,
+                'Is Sold Out': option_is_sold_out}
 
     @staticmethod
     def get_options_types(options):
@@ -315,12 +549,15 @@ class Products:
         if option_type_raw.find(CFG.COLON) != CFG.NOT_FOUND else option_type_raw
                                            for option_type_raw in options_types_raw])
 
-    def get_product_info(self, product):
+    def get_products_info(self):
         """
-        Given a product, return its information
-        :return: products_df row: object dataframe row
+        Renders the information (types, options, prices and sold out status)
+        of each product once, grouping the rows of products_df by name.
+        :return: dictionary with the rendered information of each product name
         """
-        return self.products_df.loc[product]
+        return {name: str(product_info.droplevel('Name'))
+                for name, product_info in self.products_df.groupby(level='Name', sort=False,
+                                                                   observed=True)}
 
     def sort_products(self, how, is_in_ascending_order):
         """
@@ -347,109 +584,148 @@ class Products:
         This function takes a dataframe of products and inserts all the
         data into the general_product_name and all_products tables in a
         pre-existing plant_db SQL database. The tables are first
-        refreshed before values are updated. All user information to
-        connect to the database can be modified in the
-        web_scraper_config.py file.
-        """
-        connection = pymysql.connect(host=CFG.SQL_HOST,
-                                     user=CFG.SQL_USER,
-                                     password=CFG.SQL_PASS,
-                                     db=CFG.SQL_DB,
-                                     charset=CFG.SQL_CHARSET,
-                                     cursorclass=pymysql.cursors.DictCursor
-                                     )
-
-        try:
-            with connection.cursor() as cursor:
-                sql_command_delete_general = """DELETE FROM general_product_names"""
-                cursor.execute(sql_command_delete_general)
-            connection.commit()
-        except Exception:
-            pass
+        refreshed before values are updated, and the rows of each table are
+        written in batches within a single transaction.
+        """
+        import db_func
+        products = self.products_df.reset_index()
+        type_ids = {name: type_id
+                    for type_id, name in enumerate(products['Name'].unique())}
+        general_rows = [(type_id, name, False) for name, type_id in type_ids.items()]
+        all_products_rows = [(product_id, type_ids[name],
+                              name + ' ' + str(options_types) + ' ' + str(option),
+                              price, int(is_sold_out), False)
+                             for product_id, (name, options_types, option, price, is_sold_out)
+                             in enumerate(zip(products['Name'], products['Type'],
+                                              products['Option'], products['Price'],
+                                              products['Is Sold Out']))]
+
+        connection = db_func.connect()
+        db_func.clear_tables(connection, ['all_products', 'general_product_names'])
+        general_counts = db_func.insert_rows(connection, 'general_product_names', general_rows)
+        all_products_counts = db_func.insert_rows(connection, 'all_products', all_products_rows)
+        connection.close()
+        print(f'Database updated: {general_counts[CFG.INSERTED_INDEX]} product types and '
+              f'{all_products_counts[CFG.INSERTED_INDEX]} products written '
+              f'({general_counts[CFG.FAILED_INDEX] + all_products_counts[CFG.FAILED_INDEX]} '
+              f'failed)')
 
-        try:
-            with connection.cursor() as cursor:
-                sql_command_delete_all = """ DELETE FROM all_products"""
-                cursor.execute(sql_command_delete_all)
-            connection.commit()
-        except Exception:
-            pass
-
-        repeated = {}
-        type_id = 0
-        product_id = 0
-
-        for index, rows in self.products_df.iterrows():
-            if index[CFG.NAME_INDEX] not in repeated.keys():
-                repeated[index[CFG.NAME_INDEX]] = type_id
+    def sync_products_df(self):
+        """
+        This function incrementally synchronizes the general_product_names
+        and all_products tables with the dataframe of products: products are
+        matched by full_product_name (and types by type_name), so only new,
+        changed and removed ones are written, and existing ids are kept
+        across runs. The rows added by the API enrichment (from_api) are not
+        removed. The rows actually written and removed are reported, together
+        with those that failed.
+        """
+        import db_func
+        scraped_products = self.get_full_products()
+        scraped_names = {name for name, _, _ in scraped_products.values()}
+
+        connection = db_func.connect()
+        general_rows = db_func.fetch_rows(connection, 'general_product_names',
+                                          ['type_id', 'type_name', 'from_api'])
+        type_ids = {row['type_name']: row['type_id'] for row in general_rows}
+        current_products = {row['full_product_name']: row
+                            for row in db_func.fetch_rows(connection, 'all_products',
+                                                          ['product_id', 'type_id',
+                                                           'full_product_name', 'price',
+                                                           'sold_out', 'from_api'])}
+        kept_type_ids = {row['type_id'] for row in general_rows if row['from_api']} \
+            | {current['type_id'] for current in current_products.values()
+               if current['from_api']}
+
+        new_general_rows = []
+        type_id = db_func.next_id(connection, 'general_product_names', 'type_id')
+        for name in self.products_df.index.unique(level='Name'):
+            if name not in type_ids:
+                type_ids[name] = type_id
+                new_general_rows.append((type_id, name, False))
                 type_id += 1
 
-                if rows['Is Sold Out']:
-                    bool_val = 1
-                else:
-                    bool_val = 0
-
-                try:
-                    with connection.cursor() as cursor:
-                        sql_command_general = \
-                            """ INSERT INTO general_product_names VALUES (%s, %s)"""
-                        cursor.execute(sql_command_general,
-                                       (repeated.get(index[CFG.NAME_INDEX]),
-                                        index[CFG.NAME_INDEX]))
-                    connection.commit()
-                except Exception:
-                    pass
-
-                try:
-                    with connection.cursor() as cursor:
-                        sql_command_products = \
-                         """ INSERT INTO all_products VALUES (%s, %s, %s, %s, %s)"""
-                        cursor.execute(sql_command_products,
-                                       (product_id,
-                                        repeated.get(index[CFG.NAME_INDEX]),
-                                        index[CFG.NAME_INDEX] + ' '
-                                        + str(index[CFG.TYPE_INDEX]) + ' ' +
-                                        str(index[CFG.OPTION_INDEX]),
-                                        rows['Price'], bool_val))
-
-                    connection.commit()
-                except Exception:
-                    pass
-
-            else:
-
-                if rows['Is Sold Out']:
-                    bool_val = 1
-                else:
-                    bool_val = 0
-
-                try:
-                    with connection.cursor() as cursor:
-                        sql_command_general = \
-                            """ INSERT INTO general_product_names VALUES (%s, %s)"""
-                        cursor.execute(sql_command_general,
-                                       (repeated.get(index[CFG.NAME_INDEX]),
-                                        index[CFG.NAME_INDEX]))
-                    connection.commit()
-                except Exception:
-                    pass
-
-                try:
-                    with connection.cursor() as cursor:
-                        sql_command_products = \
-                         """ INSERT INTO all_products VALUES (%s, %s, %s, %s, %s)"""
-                        cursor.execute(sql_command_products,
-                                       (product_id, repeated.get(index[CFG.NAME_INDEX]),
-                                        index[CFG.NAME_INDEX] + ' '
-                                        + str(index[CFG.TYPE_INDEX]) + ' ' +
-                                        str(index[CFG.OPTION_INDEX]), rows['Price'], bool_val))
-                    connection.commit()
-                except Exception:
-                    pass
-
-            product_id += 1
-
+        new_products_rows = []
+        changed_products_rows = []
+        product_id = db_func.next_id(connection, 'all_products', 'product_id')
+        for full_product_name, (name, price, is_sold_out) in scraped_products.items():
+            current = current_products.get(full_product_name)
+            if current is None:
+                new_products_rows.append((product_id, type_ids[name], full_product_name,
+                                          price, is_sold_out, False))
+                product_id += 1
+            elif current['type_id'] != type_ids[name] \
+                    or round(current['price'], CFG.PRICE_DECIMALS) \
+                    != round(price, CFG.PRICE_DECIMALS) \
+                    or current['sold_out'] != is_sold_out or current['from_api']:
+                changed_products_rows.append((current['product_id'], type_ids[name],
+                                              full_product_name, price, is_sold_out, False))
+        removed_products = [(current['product_id'],)
+                            for full_product_name, current in current_products.items()
+                            if full_product_name not in scraped_products
+                            and not current['from_api']]
+        removed_types = [(type_id,) for name, type_id in type_ids.items()
+                         if name not in scraped_names and type_id not in kept_type_ids]
+
+        general_counts = db_func.insert_rows(connection, 'general_product_names',
+                                             new_general_rows)
+        new_counts = db_func.insert_rows(connection, 'all_products', new_products_rows)
+        changed_counts = db_func.upsert_rows(connection, 'all_products',
+                                             ['product_id', 'type_id', 'full_product_name',
+                                              'price', 'sold_out', 'from_api'],
+                                             changed_products_rows,
+                                             ['type_id', 'price', 'sold_out', 'from_api'])
+        deleted_products = db_func.delete_rows(connection, 'all_products', ['product_id'],
+                                               removed_products)
+        deleted_types = db_func.delete_rows(connection, 'general_product_names', ['type_id'],
+                                            removed_types)
         connection.close()
+        failed = general_counts[CFG.FAILED_INDEX] + new_counts[CFG.FAILED_INDEX] \
+            + changed_counts[CFG.FAILED_INDEX] + len(removed_products) - deleted_products \
+            + len(removed_types) - deleted_types
+        print(f'Database synchronized: {new_counts[CFG.INSERTED_INDEX]} new, '
+              f'{changed_counts[CFG.INSERTED_INDEX]} updated and {deleted_products} removed '
+              f'products ({failed} failed)')
+
+    def snapshot_products_df(self):
+        """
+        This function appends to the product_snapshots table the products whose
+        price or sold out status changed since their last snapshot (or that have
+        no snapshot yet), so that their history is kept without storing the whole
+        catalog on every run.
+        """
+        import db_func
+        captured_at = datetime.datetime.now().replace(microsecond=0)
+        connection = db_func.connect()
+        latest_snapshots = {row['full_product_name']: row
+                            for row in db_func.fetch_latest_rows(connection, 'product_snapshots',
+                                                                 'full_product_name',
+                                                                 'captured_at',
+                                                                 ['price', 'sold_out'])}
+        snapshots_rows = []
+        for full_product_name, (_, price, is_sold_out) in self.get_full_products().items():
+            latest = latest_snapshots.get(full_product_name)
+            if latest is None \
+                    or round(latest['price'], CFG.PRICE_DECIMALS) \
+                    != round(price, CFG.PRICE_DECIMALS) \
+                    or latest['sold_out'] != is_sold_out:
+                snapshots_rows.append((None, full_product_name, price, is_sold_out, captured_at))
+        inserted, failed = db_func.insert_rows(connection, 'product_snapshots', snapshots_rows)
+        connection.close()
+        print(f'Price and stock history updated: {inserted} products changed '
+              f'({failed} failed)')
+
+    def get_full_products(self):
+        """
+        Given the products, returns them by the full name used in the database.
+        :return: dictionary - full_product_name: (name, price, is sold out)
+        """
+        products = self.products_df.reset_index()
+        return {name + ' ' + str(options_types) + ' ' + str(option):
+                (name, float(price), int(is_sold_out))
+                for name, options_types, option, price, is_sold_out
+                in zip(products['Name'], products['Type'], products['Option'],
+                       products['Price'], products['Is Sold Out'])}
 
     def output_products(self, **kwargs):
         """
@@ -461,52 +737,44 @@ class Products:
             self.products_df.to_csv('products.csv')
         elif kwargs['output'].lower() == 'json':
             self.products_df.to_json('products.json', orient="index")
+        elif kwargs['output'].lower() in CFG.COLUMNAR_FORMATS:
+            import columnar
+            columnar.write(self.products_df.reset_index(), 'products', kwargs['output'].lower(),
+                           CFG.PRODUCTS_DTYPES)
 
     @staticmethod
     def api_products_to_sql(api_info):
         """
         This function take a dictionary with crops and their features and inserts the data into the
-        tables relevant to products in the SQL database that has already been created.
+        tables relevant to products in the SQL database that has already been created. Crops are
+        matched by type_name and full_product_name, so only the new ones are inserted (marked as
+        from_api) and the others keep their ids.
         """
+        import db_func
         logging.info('Updating database with product API info')
-        connection = pymysql.connect(host=CFG.SQL_HOST,
-                                     user=CFG.SQL_USER,
-                                     password=CFG.SQL_PASS,
-                                     db=CFG.SQL_DB,
-                                     charset=CFG.SQL_CHARSET,
-                                     cursorclass=pymysql.cursors.DictCursor
-                                     )
-        cursor = connection.cursor()
-        connection.commit()
-
-        sql_count_general = """ Select count(*) from general_product_names"""
-        cursor.execute(sql_count_general)
-        gen_prod_counts = cursor.fetchall()[0].get('count(*)') + 1
-
-        sql_count_all = """ Select count(*) from all_products"""
-        cursor.execute(sql_count_all)
-        all_prod_counts = cursor.fetchall()[0].get('count(*)') + 1
-
-        for product in api_info.keys():
-            try:
-                with connection.cursor() as cursor:
-                    sql_general = """ INSERT INTO general_product_names VALUES (%s, %s)"""
-                    cursor.execute(sql_general, (gen_prod_counts, product))
-                connection.commit()
-            except Exception:
-                pass
-
-            try:
-                with connection.cursor() as cursor:
-                    sql_all = """ INSERT INTO all_products VALUES (%s, %s, %s, %s, %s)"""
-                    cursor.execute(sql_all, (all_prod_counts, gen_prod_counts,
-                                             product, 0, 1))
-                connection.commit()
-            except Exception:
-                pass
-
-            all_prod_counts += 1
-            gen_prod_counts += 1
+        connection = db_func.connect()
+        type_ids = {row['type_name']: row['type_id']
+                    for row in db_func.fetch_rows(connection, 'general_product_names',
+                                                  ['type_id', 'type_name'])}
+        current_products = {row['full_product_name']
+                            for row in db_func.fetch_rows(connection, 'all_products',
+                                                          ['full_product_name'])}
+
+        general_rows = []
+        type_id = db_func.next_id(connection, 'general_product_names', 'type_id')
+        for product in api_info:
+            if product not in type_ids:
+                type_ids[product] = type_id
+                general_rows.append((type_id, product, True))
+                type_id += 1
+        all_products_rows = []
+        product_id = db_func.next_id(connection, 'all_products', 'product_id')
+        for product in api_info:
+            if product not in current_products:
+                all_products_rows.append((product_id, type_ids[product], product, 0, 1, True))
+                product_id += 1
+        db_func.insert_rows(connection, 'general_product_names', general_rows)
+        db_func.insert_rows(connection, 'all_products', all_products_rows)
 
         logging.info('Product API update completed')
         connection.close()
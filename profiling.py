@@ -0,0 +1,75 @@
+"""
+Authors: Isaac Misri, Sergio Drajner
+Description: This script contains the profiling tools of the web scraper:
+running the whole process under cProfile (--profile) and, with
+--trace-memory, tracing the memory allocated while the dataframes are built.
+"""
+import cProfile
+import pstats
+import logging
+import functools
+import tracemalloc
+import web_scraper_config as CFG
+
+memory_is_traced = False
+
+
+def configure(**kwargs):
+    """
+    Enables the memory tracing of the dataframes building if --trace-memory
+    was chosen.
+    :param kwargs: parameters received from the CLI
+    :return:
+    """
+    global memory_is_traced
+    memory_is_traced = bool(kwargs.get('trace_memory'))
+
+
+def profile(function, file_name, **kwargs):
+    """
+    Runs function under cProfile, writes the statistics to file_name (to be
+    read with pstats or snakeviz) and prints the functions that took the most
+    time, including the functions they called.
+    :param function: function to profile
+    :param file_name: string - name of the .pstats file
+    :param kwargs: arguments of function
+    :return: the result of function
+    """
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(function, **kwargs)
+    finally:
+        profiler.dump_stats(file_name)
+        print(f'Profile written to {file_name}')
+        pstats.Stats(profiler).sort_stats(pstats.SortKey.CUMULATIVE) \
+            .print_stats(CFG.PROFILE_TOP_FUNCTIONS)
+
+
+def trace_memory(name):
+    """
+    Decorator that traces the memory allocated by the decorated function when
+    --trace-memory was chosen, and prints and logs its peak and the lines that
+    allocated the most memory still in use at its end.
+    :param name: string - name of the traced stage
+    :return: decorator
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def traced(*args, **kwargs):
+            if not memory_is_traced or tracemalloc.is_tracing():
+                return function(*args, **kwargs)
+            tracemalloc.start(CFG.TRACE_MEMORY_FRAMES)
+            try:
+                return function(*args, **kwargs)
+            finally:
+                current, peak = tracemalloc.get_traced_memory()
+                snapshot = tracemalloc.take_snapshot()
+                tracemalloc.stop()
+                top_lines = snapshot.statistics('lineno')[:CFG.TRACE_MEMORY_TOP_LINES]
+                report = f'Memory of {name}: peak {peak / 1024 ** 2:.1f} MiB, ' \
+                         f'{current / 1024 ** 2:.1f} MiB still in use\n' + \
+                         '\n'.join(f'    {line}' for line in top_lines)
+                print(report)
+                logging.info(report)
+        return traced
+    return decorator
@@ -0,0 +1,122 @@
+"""
+Authors: Isaac Misri, Sergio Drajner
+Description: This script contains the rate limiter shared by every request
+sent to the web shop. Requests are limited by a token bucket (a number of
+requests per second, with bursts), failed requests are retried after an
+exponential backoff with jitter (or after the time asked by the server in its
+Retry-After header), and the number of requests sent at the same time is
+reduced when too many of them fail.
+"""
+import time
+import random
+import logging
+from collections import deque
+from email.utils import parsedate_to_datetime
+import web_scraper_config as CFG
+
+
+class RateLimiter:
+    """
+    This is the class related to the rate limiter. The number of requests sent
+    at the same time starts at max_concurrency, is halved when the error rate of
+    the last CFG.ERROR_WINDOW requests goes over CFG.ERROR_RATE_THRESHOLD, and
+    grows again by one after CFG.ERROR_WINDOW requests in a row without errors.
+    """
+    def __init__(self, rate, burst, max_concurrency):
+        """
+        Constructor for RateLimiter.
+        :param rate: float - requests per second (None or 0 for no limit)
+        :param burst: int - number of requests that can be sent at once
+        :param max_concurrency: int - maximum number of requests sent at the same time
+        """
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.max_concurrency = max(max_concurrency, 1)
+        self.concurrency = self.max_concurrency
+        self.active = 0
+        self.outcomes = deque(maxlen=CFG.ERROR_WINDOW)
+        self.paused_until = 0
+
+    def reserve(self):
+        """
+        Takes a token and a slot for a request, if both are available.
+        :return: wait_time: 0 if the request can be sent, otherwise the seconds
+        to wait before trying again
+        """
+        now = time.monotonic()
+        if now < self.paused_until:
+            return self.paused_until - now
+        if self.active >= self.concurrency:
+            return CFG.SLOT_WAIT_TIME
+        if self.rate:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens < 1:
+                return (1 - self.tokens) / self.rate
+            self.tokens -= 1
+        self.active += 1
+        return 0
+
+    def release(self, failed, retry_after=None):
+        """
+        Frees the slot of a request and adapts the concurrency to its outcome.
+        If the server asked to wait (Retry-After), no request is sent until then.
+        :param failed: bool - True if the request failed with an error worth retrying
+        :param retry_after: float - seconds the server asked to wait, if any
+        :return:
+        """
+        self.active -= 1
+        if retry_after is not None:
+            self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+        self.outcomes.append(failed)
+        if failed and sum(self.outcomes) > CFG.ERROR_RATE_THRESHOLD * self.outcomes.maxlen \
+                and self.concurrency > 1:
+            self.concurrency = max(self.concurrency // 2, 1)
+            self.outcomes.clear()
+            logging.warning(f'Too many failed requests, concurrency reduced to {self.concurrency}')
+        elif len(self.outcomes) == self.outcomes.maxlen and not any(self.outcomes) \
+                and self.concurrency < self.max_concurrency:
+            self.concurrency += 1
+            self.outcomes.clear()
+            logging.info(f'Concurrency increased to {self.concurrency}')
+
+    @staticmethod
+    def get_backoff(attempt, wait_time, retry_after=None):
+        """
+        :param attempt: int - number of the failed attempt (starting at 0)
+        :param wait_time: float - base time to wait (in seconds)
+        :param retry_after: float - seconds the server asked to wait, if any
+        :return: backoff: seconds to wait before the next attempt, doubled after
+        each attempt (up to CFG.MAX_BACKOFF) with a random jitter, and never
+        shorter than retry_after
+        """
+        backoff = min(CFG.MAX_BACKOFF, wait_time * 2 ** attempt)
+        backoff = backoff / 2 + random.uniform(0, backoff / 2)
+        return max(backoff, retry_after or 0)
+
+    @staticmethod
+    def parse_retry_after(value):
+        """
+        :param value: string - value of the Retry-After header (seconds or an HTTP date), or None
+        :return: retry_after: seconds to wait (up to CFG.MAX_BACKOFF), or None
+        """
+        if value is None:
+            return None
+        try:
+            retry_after = float(value)
+        except ValueError:
+            try:
+                retry_after = parsedate_to_datetime(value).timestamp() - time.time()
+            except (TypeError, ValueError):
+                return None
+        return min(max(retry_after, 0), CFG.MAX_BACKOFF)
+
+    @staticmethod
+    def is_retryable(status_code):
+        """
+        :param status_code: int - status of a response
+        :return: True if the request is worth retrying (too many requests or server errors)
+        """
+        return status_code in CFG.RETRY_STATUS_CODES
@@ -0,0 +1,173 @@
+"""
+Authors: Isaac Misri, Sergio Drajner
+Description: This script contains the persistent cache of the downloaded pages.
+Pages are stored on disk by url together with their ETag and Last-Modified
+headers so that later runs can revalidate them with conditional requests.
+"""
+import os
+import json
+import time
+import hashlib
+import logging
+
+BODY_EXTENSION = '.body'
+META_EXTENSION = '.json'
+
+
+class ResponseCache:
+    """
+    This is the class related to the on-disk cache of responses. Entries are
+    fresh for ttl seconds, after which they have to be revalidated. When the
+    cache grows beyond max_size bytes, the least recently used entries are
+    evicted until it is down to low_water (a fraction of max_size), so that
+    the entries are not listed and sorted again on every store.
+    """
+    def __init__(self, directory, max_size, ttl, low_water=1):
+        """
+        Constructor for ResponseCache.
+        :param directory: string - folder where the entries are stored
+        :param max_size: int - maximum size of the stored bodies (in bytes)
+        :param ttl: int - seconds during which an entry is used without revalidating it
+        :param low_water: float - fraction of max_size the cache is evicted down to
+        """
+        self.directory = directory
+        self.max_size = max_size
+        self.low_water_size = max_size * low_water
+        self.ttl = ttl
+        os.makedirs(self.directory, exist_ok=True)
+        self.size = sum(os.path.getsize(path) for path in self.get_bodies_paths())
+
+    def get_paths(self, url):
+        """
+        :param url: string
+        :return: body_path, meta_path: paths of the files of the entry of the url
+        """
+        key = os.path.join(self.directory, hashlib.sha1(url.encode()).hexdigest())
+        return key + BODY_EXTENSION, key + META_EXTENSION
+
+    def get_bodies_paths(self):
+        """
+        :return: list of the paths of all the stored bodies
+        """
+        return [os.path.join(self.directory, file_name)
+                for file_name in os.listdir(self.directory)
+                if file_name.endswith(BODY_EXTENSION)]
+
+    def get_urls(self):
+        """
+        :return: list of the urls of all the stored entries
+        """
+        urls = []
+        for body_path in self.get_bodies_paths():
+            try:
+                with open(body_path[:-len(BODY_EXTENSION)] + META_EXTENSION) as meta_file:
+                    urls.append(json.load(meta_file)['url'])
+            except (OSError, ValueError, KeyError):
+                continue
+        return urls
+
+    def lookup(self, url):
+        """
+        Given a url, returns its cached entry and marks it as recently used.
+        :param url: string
+        :return: meta, body: dictionary and bytes, or None if the url is not cached
+        """
+        body_path, meta_path = self.get_paths(url)
+        try:
+            with open(meta_path) as meta_file:
+                meta = json.load(meta_file)
+            with open(body_path, 'rb') as body_file:
+                body = body_file.read()
+        except (OSError, ValueError):
+            return None
+        os.utime(body_path)
+        return meta, body
+
+    def is_fresh(self, meta):
+        """
+        :param meta: dictionary - information of a cached entry
+        :return: True if the entry can be used without revalidating it
+        """
+        return time.time() - meta['stored_at'] < self.ttl
+
+    @staticmethod
+    def get_conditional_headers(meta):
+        """
+        :param meta: dictionary - information of a cached entry
+        :return: headers: dictionary with the headers to revalidate the entry
+        """
+        headers = {}
+        if meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        if meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
+        return headers
+
+    def store(self, url, headers, body, encoding=None):
+        """
+        Stores the body of a downloaded page and its validators.
+        :param url: string
+        :param headers: headers of the response
+        :param body: bytes - content of the response
+        :param encoding: string - encoding of the content
+        :return:
+        """
+        body_path, meta_path = self.get_paths(url)
+        meta = {'url': url,
+                'etag': headers.get('ETag'),
+                'last_modified': headers.get('Last-Modified'),
+                'content_type': headers.get('Content-Type'),
+                'encoding': encoding,
+                'stored_at': time.time()}
+        previous_size = os.path.getsize(body_path) if os.path.exists(body_path) else 0
+        try:
+            self.write_file(body_path, body, 'wb')
+            self.write_file(meta_path, json.dumps(meta), 'w')
+        except OSError as error:
+            logging.error(f'Could not store {url} in the cache: {error}')
+            return
+        self.size += len(body) - previous_size
+        if self.size > self.max_size:
+            self.evict()
+
+    def refresh(self, url, meta):
+        """
+        Marks a cached entry as fresh again after a successful revalidation.
+        :param url: string
+        :param meta: dictionary - information of the cached entry
+        :return:
+        """
+        meta['stored_at'] = time.time()
+        self.write_file(self.get_paths(url)[1], json.dumps(meta), 'w')
+
+    @staticmethod
+    def write_file(path, content, mode):
+        """
+        Writes a file atomically, so that a crash never leaves half an entry.
+        :param path: string
+        :param content: string or bytes
+        :param mode: 'w' or 'wb'
+        :return:
+        """
+        temporary_path = path + '.tmp'
+        with open(temporary_path, mode) as temporary_file:
+            temporary_file.write(content)
+        os.replace(temporary_path, path)
+
+    def evict(self):
+        """
+        Removes the least recently used entries until the cache is down to
+        its low water size.
+        :return:
+        """
+        for body_path in sorted(self.get_bodies_paths(), key=os.path.getmtime):
+            if self.size <= self.low_water_size:
+                break
+            size = os.path.getsize(body_path)
+            for path in (body_path, body_path[:-len(BODY_EXTENSION)] + META_EXTENSION):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            self.size -= size
+        logging.info(f'Cache evicted down to {self.size} bytes')
@@ -0,0 +1,117 @@
+"""
+Authors: Isaac Misri, Sergio Drajner
+Description: This script contains what the crawl engines share to schedule
+the pages: each distinct page is downloaded and parsed only once per run,
+however many listing pages and features refer to it, and responses are only
+kept until they are used. Each engine gives the objects that wait for a page
+and the queue its workers download the pages from.
+"""
+import itertools
+from urls import canonicalize
+import fetcher
+import metrics
+
+
+class Scheduler:
+    """
+    This is the class related to the pages requested by a crawl engine. The
+    pages are kept by canonical url while they are downloaded and until they
+    are used, so that all the requests of a page share its download; then
+    only their parsed results are kept, so that parsing a page again returns
+    the same result. Pages that could not be downloaded (or did not answer
+    200) are forgotten, so that they can be requested again.
+    """
+    def __init__(self):
+        """
+        Constructor for Scheduler.
+        """
+        self.order = itertools.count()
+        self.pages = {}
+        self.parsed = {}
+
+    def create_result(self):
+        """
+        :return: result: the object the requests of a page wait on (set by the workers)
+        """
+        raise NotImplementedError
+
+    def enqueue(self, item):
+        """
+        Queues a page for the workers of the engine.
+        :param item: (priority, order, url, result)
+        :return:
+        """
+        raise NotImplementedError
+
+    def request(self, url, priority):
+        """
+        Queues the download of a page, unless it is already being downloaded
+        or waiting to be used.
+        :param url: string
+        :param priority: int - priority of the page (the lower, the sooner)
+        :return: result: the object that waits for the response of the page
+        """
+        key = canonicalize(url)
+        if key not in self.pages:
+            self.pages[key] = self.create_result()
+            self.enqueue((priority, next(self.order), url, self.pages[key]))
+        return self.pages[key]
+
+    def downloaded(self, url, result, web_page):
+        """
+        Called by the workers once a page is downloaded: a page that is not
+        available is forgotten (the requests that are waiting for it still get
+        its response).
+        :param url: string
+        :param result: the object that waits for the response of the page
+        :param web_page: response object, or None
+        :return:
+        """
+        if fetcher.get_content(web_page) is None:
+            self.release(url, result)
+
+    def release(self, url, result):
+        """
+        Forgets the response of a page once it has been used (the requests
+        that are waiting for it still get it). A page that is requested again
+        afterwards is downloaded again, from the cache if it is used.
+        :param url: string
+        :param result: the object that waits for the response of the page
+        :return:
+        """
+        key = canonicalize(url)
+        if self.pages.get(key) is result:
+            del self.pages[key]
+
+    @staticmethod
+    def get_key(url, parse_function, args):
+        """
+        :param url: string
+        :param parse_function: function that takes the content of the page and args
+        :param args: tuple - other arguments of parse_function
+        :return: key: the key of the parsed result
+        """
+        return (canonicalize(url), parse_function.__qualname__) + args
+
+    def parse_page(self, key, web_page, parse_function, args, keep):
+        """
+        Returns the result of parse_function for the content of a page (and
+        args), keeping it unless keep is False. If another request of the page
+        parsed it in the meantime, its result is returned instead.
+        :param key: the key of the parsed result (see get_key)
+        :param web_page: response object, or None
+        :param parse_function: function that takes the content of the page and args
+        :param args: tuple - other arguments of parse_function
+        :param keep: bool - False not to keep the result once it is returned
+        :return: the result of parse_function, or None if the page is not available
+        """
+        content = fetcher.get_content(web_page)
+        if content is None:
+            return None
+        if key in self.parsed:
+            return self.parsed[key]
+        with metrics.timer('parse_seconds'):
+            result = parse_function(content, *args)
+        if keep:
+            self.parsed[key] = result
+        return result
@@ -0,0 +1,23 @@
+"""
+Authors: Isaac Misri, Sergio Drajner
+Description: This script contains the functions used to handle the urls of
+the web shop, without any dependency on the crawl engines, so that every
+engine (and the benchmark) identifies the pages in the same way.
+"""
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+import web_scraper_config as CFG
+
+
+def canonicalize(url):
+    """
+    Given a url, returns the url that identifies its page: the parameters that
+    only change the view, and those that have their default value, are removed
+    and the rest are sorted.
+    :param url: string
+    :return: canonical_url: string
+    """
+    scheme, netloc, path, query, _ = urlsplit(url)
+    parameters = sorted((key, value) for key, value in parse_qsl(query.lstrip('?'))
+                        if key not in CFG.VIEW_PARAMETERS
+                        and CFG.DEFAULT_PARAMETERS.get(key) != value)
+    return urlunsplit((scheme, netloc, path, urlencode(parameters), ''))
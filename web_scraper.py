@@ -2,18 +2,65 @@
 Authors: Isaac Misri, Sergio Drajner
 Description: This script scrapes a web site for the data mining project.
 """
-import gevent.monkey
-gevent.monkey.patch_all(thread=False, select=False)
-
 import logging
 import click
-from product_info_functions import Products
-from features_functions import Features
-import output_processing as op
+import web_scraper_config as CFG
+import metrics
+import profiling
 
 CONTEXT_SETTINGS = dict(help_option_names=['-h', '--help'])
 
 
+def configure(**kwargs):
+    """
+    Prepares the modules used for scraping: patches the sockets for the gevent
+    engine and configures the fetcher, the parser, the checkpoint and the
+    crawl engine. The scraping modules (and their dependencies: gevent,
+    requests, bs4, aiohttp) are only imported when scraping, or the fetcher
+    when enriching from the API.
+    :param kwargs: parameters received from the CLI
+    :return:
+    """
+    profiling.configure(**kwargs)
+    if kwargs['scrape'] and kwargs['engine'] == 'gevent':
+        # the sockets must be patched before the modules that use them are imported, and
+        # only for the gevent engine, as it would take over the event loop of asyncio
+        import gevent.monkey
+        gevent.monkey.patch_all(thread=False, select=False)
+    if kwargs['scrape'] or kwargs['enrich']:
+        import fetcher
+        fetcher.configure(**kwargs)
+    if kwargs['scrape']:
+        import parsing
+        import checkpoint
+        parsing.configure(**kwargs)
+        checkpoint.configure(**kwargs)
+        if kwargs['engine'] == 'gevent':
+            import frontier
+            frontier.configure(**kwargs)
+        else:
+            import async_engine
+            async_engine.configure(**kwargs)
+
+
+def get_features_and_products(**kwargs):
+    """
+    Gets the features and the products (scraped or read from the csv files),
+    each one as a stage of the metrics.
+    :param kwargs: parameters received from the CLI
+    :return: features, products: Features and Products objects
+    """
+    from product_info_functions import Products
+    from features_functions import Features
+    with metrics.stage('features'):
+        features = Features(**kwargs)
+        metrics.increment('rows', len(features.features_and_products_df))
+    with metrics.stage('products'):
+        products = Products(features.features_and_products_df, **kwargs)
+        metrics.increment('rows', len(products.products_df))
+    return features, products
+
+
 @click.command(context_settings=CONTEXT_SETTINGS)
 @click.version_option(version='3.0.0')
 @click.option('--feature', help='Type a filter to get specific features (default: All)', type=str)
@@ -22,7 +69,20 @@ CONTEXT_SETTINGS = dict(help_option_names=['-h', '--help'])
               type=float)
 @click.option('--output', '-o', help='Where do you want to write the data? (Default: no output '
                                      'unless you want to display on the screen)',
-              type=click.Choice(['db', 'csv', 'json'], case_sensitive=False))
+              type=click.Choice(['db', 'csv', 'json', 'parquet', 'feather'],
+                                case_sensitive=False))
+@click.option('--stream', help='Write the products as soon as they are scraped, to products.csv, '
+                               'products.jsonl or the screen (as csv), instead of keeping '
+                               'them to be sorted, displayed and output at the end',
+              type=click.Choice(['csv', 'jsonl', 'stdout'], case_sensitive=False))
+@click.option('--input', '-i', help='Which files do you want to read the data from with '
+                                    '--no-scrape? (Default: csv)',
+              type=click.Choice(['csv', 'parquet', 'feather'], case_sensitive=False))
+@click.option('--db-mode', help="How do you want to write to the database? 'sync' only writes "
+                                  "the new, changed and removed products and features, keeping "
+                                  "their ids; 'replace' deletes the tables and fills them again "
+                                  "(Default: sync)",
+              type=click.Choice(['sync', 'replace'], case_sensitive=False), default='sync')
 @click.option('--sort', '-s', help="Would you like your output sorted? (Default: unsorted). "
                                    "If so, how? By 'n'ame or by 'p'rice? "
                                    "'A'scending or 'd'escending order? (Default: ascending order)",
@@ -31,11 +91,43 @@ CONTEXT_SETTINGS = dict(help_option_names=['-h', '--help'])
               type=int)
 @click.option('--sleep', '-sl', help='How long do you want to wait between attempts to scrape '
                                      'the data (in seconds)?', type=int)
+@click.option('--concurrency', '-c', help='How many product pages do you want to download at '
+                                          'the same time?', type=int)
+@click.option('--timeout', '-t', help='How long do you want to wait for a page to respond '
+                                      '(in seconds)?', type=float)
+@click.option('--rate', help='How many requests per second do you want to send to the web shop '
+                               'at most? (0 for no limit)', type=float)
+@click.option('--burst', help='How many requests do you want to allow to be sent at once when '
+                              'the web shop has not been requested for a while?', type=int)
 @click.option('--sold-out/--not-sold-out', '-so/-nso',
               help="Items sold out or not (default: All)", default=None)
 @click.option('--scrape/--no-scrape', help='Where is the data coming from? Choose --no-scrape'
                                            'if you want to get it from csv files (Default: '
                                            'scrape', default=True)
+@click.option('--engine', help="Which engine do you want to crawl the pages with? 'gevent' "
+                                 "uses a pool of greenlets; 'async' uses asyncio and aiohttp "
+                                 "(Default: gevent)",
+              type=click.Choice(['gevent', 'async'], case_sensitive=False), default='gevent')
+@click.option('--cache/--no-cache', help='Use the pages downloaded by previous runs when '
+                                         'they have not changed (Default: yes)?', default=True)
+@click.option('--parser', help='Which parser do you want to use for the pages? (Default: lxml '
+                                 'if installed, otherwise html.parser)',
+              type=click.Choice(['lxml', 'html.parser'], case_sensitive=False))
+@click.option('--resume/--no-resume', help='Continue the previous crawl from its checkpoint, '
+                                           'skipping the work already done (Default: no)?',
+              default=False)
+@click.option('--metrics-file', help='Where do you want to write the JSON summary of the '
+                                     'metrics of each stage? (Default: web_scraper_metrics.json)',
+              type=click.Path(dir_okay=False))
+@click.option('--prometheus', help='Also write the metrics to this file in the Prometheus text '
+                                   'format', type=click.Path(dir_okay=False))
+@click.option('--profile', help='Run the web scraper under cProfile, write the statistics to '
+                                'this .pstats file and display the slowest functions',
+              type=click.Path(dir_okay=False))
+@click.option('--trace-memory/--no-trace-memory', help='Display the memory peak and the lines '
+                                                       'that allocate the most memory while '
+                                                       'the dataframes are built (Default: no)?',
+              default=False)
 @click.option('--verbose/--no-verbose', help='Display to screen (Default: yes)?', default=True)
 @click.option('--enrich/--not-enrich',
               help='Enrich data base from API (Default: no)?', default=False)
@@ -56,15 +148,52 @@ def main(**kwargs):
                                'FUNC:%(funcName)s-LINE:%(lineno)d-%(message)s',
                         level=logging.INFO)
     logging.info("\tStart of script.")
-    houseplant_features = Features(**kwargs)
-    houseplant_products = Products(houseplant_features.features_and_products_df, **kwargs)
-    if kwargs['sort'] is not None:
-        op.sort_result(houseplant_features, houseplant_products, **kwargs)
-    op.output_result(houseplant_features, houseplant_products, **kwargs)
+    if kwargs['stream'] is not None and (not kwargs['scrape'] or kwargs['sort'] is not None
+                                         or kwargs['break_down'] or kwargs['output'] is not None):
+        raise click.UsageError('--stream can not be used with --no-scrape, --sort, '
+                               '--break-down or --output')
+    if kwargs['input'] is not None and kwargs['scrape']:
+        raise click.UsageError('--input can only be used with --no-scrape')
+    if kwargs['profile']:
+        profiling.profile(run, kwargs['profile'], **kwargs)
+    else:
+        run(**kwargs)
+
+
+def run(**kwargs):
+    """
+    Scrapes (or reads) the features and the products, sorts them, outputs
+    them, enriches the database and writes the metrics, according to the
+    parameters received.
+    :param kwargs: parameters received from the CLI
+    :return:
+    """
+    configure(**kwargs)
+    from product_info_functions import Products
+    from features_functions import Features
+    import output_processing as op
+    if kwargs['scrape'] and kwargs['engine'] == 'async':
+        import async_engine
+        try:
+            houseplant_features, houseplant_products = get_features_and_products(**kwargs)
+        finally:
+            async_engine.close()
+    else:
+        houseplant_features, houseplant_products = get_features_and_products(**kwargs)
+    if kwargs['stream'] is None:
+        with metrics.stage('output'):
+            if kwargs['sort'] is not None:
+                op.sort_result(houseplant_features, houseplant_products, **kwargs)
+            op.output_result(houseplant_features, houseplant_products, **kwargs)
     if kwargs['enrich'] is None or kwargs['enrich'] :
-        api_products_and_features = Features.create_api_dict()
-        Features.api_features_to_sql(api_products_and_features)
-        Products.api_products_to_sql(api_products_and_features)
+        with metrics.stage('enrich'):
+            api_products_and_features = Features.create_api_dict()
+            if api_products_and_features:
+                Features.api_features_to_sql(api_products_and_features)
+                Products.api_products_to_sql(api_products_and_features)
+    metrics.write_summary(kwargs['metrics_file'] or CFG.METRICS_FILE)
+    if kwargs['prometheus']:
+        metrics.write_prometheus(kwargs['prometheus'])
 
 if __name__ == '__main__':
     logging.info("\tEnd of script.")
@@ -21,6 +21,49 @@ ANOTHER_SEPARATOR = ' / '
 FIRST = 0
 LAST = -1
 BATCH_SIZE = 10
+CONCURRENCY = 10
+PIPELINE_QUEUE_SIZE = 20
+LISTING_PREFETCH = 20
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 30
+POOL_CONNECTIONS = 4
+PER_HOST_CONCURRENCY = 10
+RATE = 10
+BURST = 10
+MAX_BACKOFF = 60
+SLOT_WAIT_TIME = 0.05
+ERROR_WINDOW = 20
+ERROR_RATE_THRESHOLD = 0.2
+RETRY_STATUS_CODES = [429, 500, 502, 503, 504]
+LISTING_PRIORITY = 0
+FEATURE_PRIORITY = 1
+OPTION_PRIORITY = 2
+VIEW_PARAMETERS = ['grid_list']
+DEFAULT_PARAMETERS = {'page': '1'}
+BODY_INDEX = 1
+USER_AGENT = 'houseplantshop-web-scraper/3.0'
+
+CACHE_DIRECTORY = '.http_cache'
+CACHE_MAX_SIZE = 200 * 1024 * 1024
+CACHE_LOW_WATER = 0.9
+CACHE_TTL = 600
+META_INDEX = 0
+
+CHECKPOINT_FILE = 'crawl_checkpoint.jsonl'
+CHECKPOINT_LISTING_PAGES = 'listing_pages'
+CHECKPOINT_OPTION_PAGES = 'option_pages'
+CHECKPOINT_FEATURES = 'features'
+
+METRICS_FILE = 'web_scraper_metrics.json'
+METRICS_PREFIX = 'web_scraper'
+LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+
+PROFILE_TOP_FUNCTIONS = 25
+TRACE_MEMORY_FRAMES = 1
+TRACE_MEMORY_TOP_LINES = 10
+
+PARSER = 'lxml'
+FALLBACK_PARSER = 'html.parser'
 FEATURE_INDEX = 0
 URL_INDEX = 1
 PAGES_INDICATOR_INDEX = -2
@@ -29,16 +72,19 @@ LOWER = 0
 HIGHER = 1
 BY = 0
 ORDER = 1
-BEGINNING = 1
-END = -1
 FEATURE = 1
 PRODUCT = 2
 MAX_COLUMN_WIDTH = 80
 FEATURE_DIVIDER_LENGTH = 160
 PRODUCT_DIVIDER_LENGTH = 100
 
-FIRST_VALID = 1
-SKIP_INVALID = 2
+PRODUCTS_COLUMNS = ['Name', 'Type', 'Option', 'Price', 'Is Sold Out']
+FEATURES_FILE = 'features.csv'
+FEATURES_COLUMNS = ['Feature', 'Product']
+COLUMNAR_FORMATS = ['parquet', 'feather']
+PRODUCTS_DTYPES = {'Name': 'category', 'Type': 'category', 'Option': 'category',
+                   'Price': 'float32', 'Is Sold Out': 'bool'}
+FEATURES_DTYPES = {'Feature': 'category', 'Product': 'category'}
 
 NAME_INDEX = 0
 TYPE_INDEX = 1
@@ -49,5 +95,9 @@ SQL_HOST = 'localhost'
 SQL_USER = 'root'
 SQL_DB = 'plant_db'
 SQL_CHARSET = 'utf8mb4'
+DB_CHUNK_SIZE = 500
+PRICE_DECIMALS = 2
+INSERTED_INDEX = 0
+FAILED_INDEX = 1
 
 API_ADDRESS = 'https://www.growstuff.org/api/v1/crops'